@@ -1,6 +1,6 @@
+import random
 import itertools
-
-from . import features
+import tracemalloc
 
 
 ####### CONSTANTS #######
@@ -13,6 +13,192 @@ WHITE_PAWN = -1
 WHITE_KING = -3
 
 
+
+####### BITBOARD LAYOUT #######
+
+# Only the 32 dark tiles (those where x + y is even) can ever hold a piece, so the board
+# is stored as three 32-bit masks (black pieces, white pieces and kings) where every bit
+# is one of those tiles, numbered in row-major order:
+#
+#      0 .  1 .  2 .  3 .        <- row 0 (black side)
+#      .  4 .  5 .  6 .  7
+#      8 .  9 . 10 . 11 .
+#      ...
+#      . 28 . 29 . 30 . 31       <- row 7 (white side)
+
+FULL_MASK = 0xFFFFFFFF
+
+SQUARE_COORDS = tuple( (2*(s % 4) + (s // 4) % 2, s // 4) for s in range(32) )
+
+BLACK_PROMOTION_ROW = 0xF0000000
+WHITE_PROMOTION_ROW = 0x0000000F
+
+# Diagonal directions as (delta_x, delta_y). Their order is the order in which the moves
+# of a piece are listed.
+DIRECTIONS = ( (-1, 1),     # Down left
+               ( 1, 1),     # Down right
+               (-1, -1),    # Up left
+               ( 1, -1) )   # Up right
+
+# Index of the opposite of every direction.
+REVERSE_DIRECTIONS = (3, 2, 1, 0)
+
+BLACK_PAWN_DIRECTIONS = (0, 1)
+WHITE_PAWN_DIRECTIONS = (2, 3)
+KING_DIRECTIONS       = (0, 1, 2, 3)
+
+
+# Zobrist keys: a random 64-bit number for every (piece, square) pair plus keys for the side
+# to move and for the square a multi-jump has to continue from. The key of a position is the
+# XOR of the keys of everything in it. The generator is seeded so that keys are the same in
+# every process.
+_zobrist_random = random.Random(0x636865636b657273)
+
+ZOBRIST_PIECE_KEYS = { tile: tuple( _zobrist_random.getrandbits(64) for _ in range(32) )
+                       for tile in (BLACK_PAWN, BLACK_KING, WHITE_PAWN, WHITE_KING) }
+ZOBRIST_PIECE_KEYS[EMPTY] = (0,) * 32
+
+ZOBRIST_WHITE_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_JUMP_KEYS     = tuple( _zobrist_random.getrandbits(64) for _ in range(32) )
+
+
+# Temporary updates are undone in reverse order using packed integer keys kept in a fixed size
+# stack. A key holds the source and destination squares of the move, flags telling whether the
+# moving piece was a king and whether it was promoted, the turn before the move (a white to move
+# flag and the square a multi-jump had to continue from plus one, 0 if none) and, above those,
+# the mask of the captured squares and the mask of the captured kings. Keys of steps stay small.
+UNDO_STACK_SIZE = 256
+
+UNDO_DST_SHIFT            = 5
+UNDO_MOVED_KING           = 1 << 10
+UNDO_PROMOTED             = 1 << 11
+UNDO_WHITE_TO_MOVE        = 1 << 12
+UNDO_JUMP_SHIFT           = 13
+UNDO_CAPTURED_SHIFT       = 19
+UNDO_CAPTURED_KINGS_SHIFT = 51
+
+# Codes of the multi-jump sequences of a position start here, above the codes of single moves.
+SEQUENCE_CODE_BASE = 1024
+
+
+def coords_to_square(x, y):
+    '''
+    Returns the bit index of the tile (x, y), or None if the tile is not playable.
+    '''
+
+    if 0 <= x <= 7 and 0 <= y <= 7 and (x + y) % 2 == 0:
+        return 4*y + x//2
+
+    return None
+
+
+def _build_shifts(delta_x, delta_y, distance):
+    '''
+    Builds the list of (shift, source mask) pairs that move every bit of a mask
+    'distance' tiles along the given diagonal. Rows alternate their offset, so the
+    shift depends on the parity of the row, and the masks drop the bits that would
+    fall off the board.
+    '''
+
+    shifts = {}
+    for s, (x, y) in enumerate(SQUARE_COORDS):
+        target = coords_to_square(x + delta_x*distance, y + delta_y*distance)
+        if target is not None:
+            shifts[target - s] = shifts.get(target - s, 0) | (1 << s)
+
+    return tuple( sorted(shifts.items()) )
+
+
+STEP_SHIFTS = tuple( _build_shifts(dx, dy, 1) for dx, dy in DIRECTIONS )
+JUMP_SHIFTS = tuple( _build_shifts(dx, dy, 2) for dx, dy in DIRECTIONS )
+
+
+def _build_square_table(distance):
+    '''
+    Builds a table with, for every square and direction, the square 'distance' tiles away
+    along that direction, or -1 if it falls off the board.
+    '''
+
+    table = []
+    for x, y in SQUARE_COORDS:
+        squares = ( coords_to_square(x + dx*distance, y + dy*distance) for dx, dy in DIRECTIONS )
+        table.append( tuple( -1 if square is None else square for square in squares ) )
+
+    return tuple(table)
+
+
+# STEP_TABLE[s][d] is the square next to 's' along direction 'd', which is also the square
+# that is jumped over, and JUMP_TABLE[s][d] the square where a jump along 'd' lands.
+STEP_TABLE = _build_square_table(1)
+JUMP_TABLE = _build_square_table(2)
+
+# Squares where pawns of each color are promoted.
+BLACK_PROMOTION_SQUARES = tuple( bool((BLACK_PROMOTION_ROW >> s) & 1) for s in range(32) )
+WHITE_PROMOTION_SQUARES = tuple( bool((WHITE_PROMOTION_ROW >> s) & 1) for s in range(32) )
+
+
+def source_mask(targets, shifts):
+    '''
+    Returns the mask of tiles whose neighbour along the diagonal described by 'shifts'
+    is part of 'targets'.
+    '''
+
+    result = 0
+    for delta, mask in shifts:
+        if delta > 0:
+            result |= (targets >> delta) & mask
+        else:
+            result |= (targets << -delta) & mask
+
+    return result
+
+
+def tile_value(black, white, kings, bit):
+    '''
+    Returns the tile value of the square with the given bit in the given bitboards.
+    '''
+
+    if bit & black:
+        return BLACK_KING if bit & kings else BLACK_PAWN
+    elif bit & white:
+        return WHITE_KING if bit & kings else WHITE_PAWN
+
+    return EMPTY
+
+
+def iter_squares(bits):
+    '''
+    Yields the index of every set bit of a mask in ascending order.
+    '''
+
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+def traced_memory_mark():
+    '''
+    Returns the memory traced by tracemalloc as in use, and makes that the peak from which
+    traced_memory_since() measures.
+    '''
+
+    in_use = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    return in_use
+
+
+def traced_memory_since(in_use):
+    '''
+    Returns the highest amount of memory traced as in use above the one returned by
+    traced_memory_mark() since it was called.
+    '''
+
+    return tracemalloc.get_traced_memory()[1] - in_use
+
+
+
 class Board:
     '''
     Board class
@@ -21,31 +207,79 @@ class Board:
     allows to play the game, like computing the legal moves from a certain position or
     updating the board taking all the steps that it implies.
     '''
-    
+
+    # When enabled, the incrementally updated Zobrist key and piece counts are checked
+    # against a full recomputation after every change to the board.
+    debug = False
+
+    # When enabled, tracemalloc must be tracing and temporary updates and their undos add the
+    # memory they allocate to 'allocated_bytes', measured as the highest amount in use above
+    # the one they started with, count in 'allocating_updates' those that allocate anything
+    # and in 'traced_updates' all of them. Memory freed and allocated again within an update
+    # is counted once, so the figures are a lower bound.
+    trace_allocations = False
+
+    # Bytes that measuring an update that allocates nothing reports, found the first time.
+    trace_overhead = None
+
     def __init__(self, state=None):
         '''
         Initializes board object to a particular state if given or to
         beggining of game otherwise.
         '''
 
-        self.state          = state if state else self._generate_initial_state()
+        # The bitboards are the actual board representation. 'state' is an 8x8 grid view,
+        # indexed as state[y][x], that is derived from them the first time it is read after
+        # the pieces move, so it must be treated as read only.
+        #
+        # 'zobrist_key' identifies the position (pieces, color to move and the square a
+        # multi-jump must continue from, if any) and 'piece_counts' maps every tile value
+        # to the number of pieces of that kind. Both are updated along with the bitboards.
+        self.color_to_move  = 'black'
+        self.jump_square    = None
+        self.grid           = None
+        self.grid_position  = None
+        self._set_state( state if state else self._generate_initial_state() )
         self.players        = None
         self.player_in_turn = None
         self.legal_moves    = {}
+        self.turn_moves     = None
+        self.turn_sequences = None
+        self.capture_map    = None
         self.required_src   = None
         self.turn_count     = 0
         self.no_jump_count  = 0
         self.game_over      = False
 
+        self.undo_stack = [0] * UNDO_STACK_SIZE
+        self.undo_count = 0
+
+        self.allocated_bytes    = 0
+        self.allocating_updates = 0
+        self.traced_updates     = 0
+
 
     def __str__(self):
-        s = ''
-        for row in range(8):
-            for col in range(8):
-                s += '{} '.format( self.state[row][col] )
+        return ' '.join( str(tile) for row in self.state for tile in row )
+
+
+    @property
+    def state(self):
+        '''
+        The 8x8 grid view of the board, rebuilt from the bitboards when they changed since it
+        was last read.
+        '''
+
+        position = (self.black, self.white, self.kings)
+        if position != self.grid_position:
+            self.grid = [ [EMPTY] * 8 for _ in range(8) ]
+            for s in iter_squares(self.black | self.white):
+                x, y = SQUARE_COORDS[s]
+                self.grid[y][x] = self._get_square_state(s)
 
-        return s.strip()
+            self.grid_position = position
 
+        return self.grid
 
 
 ####### INTERFACE METHODS #######
@@ -66,7 +300,11 @@ class Board:
         Returns the current value for a tile.
         '''
 
-        return self.state[y][x]
+        s = coords_to_square(x, y)
+        if s is None:
+            return EMPTY
+
+        return self._get_square_state(s)
 
 
     def pass_turn(self):
@@ -75,26 +313,26 @@ class Board:
         '''
 
         self.player_in_turn = next(self.players)
+        self._set_turn(self.player_in_turn.color, None)
 
 
     def update(self, move):
         '''
         Updates the board state according to the given move if it is valid.
         '''
-        
+
         # This means that the last move was a jump, and at least another jump is available
         # so the player is required to make it.
         if (self.required_src) and (move.src != self.required_src):
             raise ValueError('Illegal move: Choose another jump with the last piece selected. {}'.format(self.required_src))
-        
-        # If there is any jump available on the board it is mandatory that the player makes it.
-        available_jumps = self._get_current_possible_jumps()
-        legal_moves = self.get_legal_moves(*move.src)
 
-        non_jump_moves = []
-        if available_jumps:
-            non_jump_moves = legal_moves
-            legal_moves = available_jumps
+        # The legal moves of the player in turn, which only hold jumps if there are any since
+        # they are mandatory, are generated once per turn and shared with the player. Complete
+        # multi-jumps are checked against the jump sequences instead of the single jumps.
+        if isinstance(move, JumpSequence):
+            legal_moves = self.get_all_compound_moves(self.player_in_turn.color)
+        else:
+            legal_moves = self.get_all_legal_moves(self.player_in_turn.color)
 
         # Check if selected move is legal.
         full_move = None
@@ -106,24 +344,13 @@ class Board:
         # Use move from legal_moves list because it cointains capture and promote information.
         if full_move:
             move = full_move
-        elif move in non_jump_moves:
+        elif legal_moves and legal_moves[0].capture and move in self.get_legal_moves(*move.src):
             raise ValueError('Illegal move: There are jumps available.')
         else:
             raise ValueError('Illegal move: That move is not allowed.')
 
-
-        # Update location of the moving piece and promote piece if neccesary.
-        self.state[move.dst[1]][move.dst[0]] = self.state[move.src[1]][move.src[0]]
-        self.state[move.src[1]][move.src[0]] = EMPTY
-        if move.promote:
-            self.state[move.dst[1]][move.dst[0]] *= 3
-
-        # Remove captured piece if any.
-        if move.capture:
-            delta_x = ( move.src[0] - move.dst[0] ) // 2
-            delta_y = ( move.src[1] - move.dst[1] ) // 2
-            captured_piece = ( move.dst[0] + delta_x, move.dst[1] + delta_y )
-            self.state[captured_piece[1]][captured_piece[0]] = EMPTY
+        # Move the piece, promote it if neccesary and remove the captured pieces if any.
+        self._move_pieces(move)
 
         # Check if the game is over.
         if self._is_game_over():
@@ -131,20 +358,19 @@ class Board:
             return
 
         # Reset moves cache.
-        self.legal_moves.clear() 
+        self.legal_moves.clear()
+        self.turn_moves     = None
+        self.turn_sequences = None
 
-        # Check if last move was a capture and there is another one available.
-        continue_turn = False
-        if move.capture:
-            legal_moves = self.get_legal_moves(*move.dst) 
-            for m in legal_moves:
-                if m.capture:
-                    continue_turn = True
+        # Check if last move was a capture and there is another one available. Jump sequences
+        # are complete, so this only happens after a single jump.
+        continue_turn = move.capture and self._can_jump_from(move.dst_square)
 
         # Update the current player if turn is over.
         if not continue_turn:
             self.required_src = None
             self.player_in_turn = next(self.players)
+            self._set_turn(self.player_in_turn.color, None)
             self.turn_count += 1
             if self.turn_count > 50 and not move.capture:
                 self.no_jump_count += 1
@@ -152,9 +378,14 @@ class Board:
                 self.no_jump_count = 0
         else:
             self.required_src = move.dst
+            self._set_turn(self.player_in_turn.color, move.dst_square)
+
+        if self.debug:
+            self._check_incremental_state()
 
-        # Check that the next player can make any moves.
-        if not self.get_all_legal_moves(self.player_in_turn.color, cache=False):
+        # Check that the next player can make any moves. This also generates the moves that
+        # the player will pick from, which are complete jump sequences if there are jumps.
+        if not self.get_all_compound_moves(self.player_in_turn.color):
             self.game_over = 2 # Game over due to player blocked (i.e. no possible moves).
             self.player_in_turn = next(self.players)
 
@@ -168,102 +399,13 @@ class Board:
         Additionally saves a copy of the legal moves for that tile until
         the board is updated.
         '''
-       
+
         # Return cached version if available.
         if cache and (x, y) in self.legal_moves:
             return self.legal_moves[(x, y)]
 
-        legal_moves = []
-        possible_capture = False
-
-        # Pawns can only go forward and may be promoted, but they go in opposite directions
-        # depending on their color so must check separately.
-        if self.state[y][x] == BLACK_PAWN:                                            # E.g.: Black pawns can go in two 
-                                                                                      #       directions, but produce 4 
-                                                                                      #       different outcomes:
-            if ( (y + 1 <= 7) and (x - 1 >= 0) and (self.state[y+1][x-1] == EMPTY) ):
-                m = Move([x, y], [x-1, y+1], capture=False)
-                if y + 1 == 7:                                                        # 1 down, 1 left - no capture
-                    m.promote = True
-                legal_moves.append(m)
-            elif ( (y + 2 <= 7) and (x - 2 >= 0) and (self.state[y+1][x-1] < 0) and (self.state[y+2][x-2] == EMPTY) ):   
-                m = Move([x, y], [x-2, y+2], capture=True)                            # 2 down, 2 left - with capture
-                if y + 2 == 7:                                                  
-                    m.promote = True
-                legal_moves.append(m)
-                possible_capture = True
-
-            if ( (y + 1 <= 7) and (x + 1 <= 7) and (self.state[y+1][x+1] == EMPTY) ): # 1 down, 1 right - no capture
-                m = Move([x, y], [x+1, y+1], capture=False)
-                if y + 1 == 7:                                                  
-                    m.promote = True
-                legal_moves.append(m)
-            elif ( (y + 2 <= 7) and (x + 2 <= 7) and (self.state[y+1][x+1] < 0) and (self.state[y+2][x+2] == EMPTY) ):
-                m = Move([x, y], [x+2, y+2], capture=True)                            # 2 down, 2 left - with capture
-                if y + 2 == 7:                                                  
-                    m.promote = True
-                legal_moves.append(m)
-                possible_capture = True
-            
-
-        elif self.state[y][x] == WHITE_PAWN:
-            if ( (y - 1 >= 0) and (x - 1 >= 0) and (self.state[y-1][x-1] == EMPTY) ):
-                m = Move([x, y], [x-1, y-1], capture=False)
-                if y - 1 == 0:
-                    m.promote = True
-                legal_moves.append(m)
-            elif ( (y - 2 >= 0) and (x - 2 >= 0) and (self.state[y-1][x-1] > 0) and (self.state[y-2][x-2] == EMPTY) ):
-                m = Move([x, y], [x-2, y-2], capture=True)
-                if y - 2 == 0:
-                    m.promote = True
-                legal_moves.append(m)
-                possible_capture = True
-
-            if ( (y - 1 >= 0) and (x + 1 <= 7) and (self.state[y-1][x+1] == EMPTY) ):
-                m = Move([x, y], [x+1, y-1], capture=False)
-                if y - 1 == 0:
-                    m.promote = True
-                legal_moves.append(m)
-            elif ( (y - 2 >= 0) and (x + 2 <= 7) and (self.state[y-1][x+1] > 0) and (self.state[y-2][x+2] == EMPTY) ):
-                m = Move([x, y], [x+2, y-2], capture=True)
-                if y - 2 == 0:
-                    m.promote = True
-                legal_moves.append(m)
-                possible_capture = True
-
-        # Kings can go in any direction so another check is done separately.
-        elif self.state[y][x] == BLACK_KING or self.state[y][x] == WHITE_KING:
-            if ( (y + 1 <= 7) and (x - 1 >= 0) and (self.state[y+1][x-1] == EMPTY) ):
-                m = Move([x, y], [x-1, y+1], capture=False)
-                legal_moves.append(m)
-            elif ( (y + 2 <= 7) and (x - 2 >= 0) and (self.state[y+1][x-1]*self.state[y][x] < 0) and (self.state[y+2][x-2] == EMPTY) ):
-                m = Move([x, y], [x-2, y+2], capture=True)
-                legal_moves.append(m)
-                possible_capture = True
-
-            if ( (y + 1 <= 7) and (x + 1 <= 7) and (self.state[y+1][x+1] == EMPTY) ):
-                m = Move([x, y], [x+1, y+1], capture=False)
-                legal_moves.append(m)
-            elif ( (y + 2 <= 7) and (x + 2 <= 7) and (self.state[y+1][x+1]*self.state[y][x] < 0) and (self.state[y+2][x+2] == EMPTY) ):
-                m = Move([x, y], [x+2, y+2], capture=True)
-                legal_moves.append(m)
-                possible_capture = True
-
-            if ( (y - 1 >= 0) and (x - 1 >= 0) and (self.state[y-1][x-1] == EMPTY) ):
-                m = Move([x, y], [x-1, y-1], capture=False)
-                legal_moves.append(m)
-            elif ( (y - 2 >= 0) and (x - 2 >= 0) and (self.state[y-1][x-1]*self.state[y][x] < 0) and (self.state[y-2][x-2] == EMPTY) ):
-                m = Move([x, y], [x-2, y-2], capture=True)
-                legal_moves.append(m)
-                possible_capture = True
-
-            if ( (y - 1 >= 0) and (x + 1 <= 7) and (self.state[y-1][x+1] == EMPTY) ):
-                m = Move([x, y], [x+1, y-1], capture=False)
-                legal_moves.append(m)
-            elif ( (y - 2 >= 0) and (x + 2 <= 7) and (self.state[y-1][x+1]*self.state[y][x] < 0) and (self.state[y-2][x+2] == EMPTY) ):
-                m = Move([x, y], [x+2, y-2], capture=True)
-                legal_moves.append(m)
-                possible_capture = True
+        s = coords_to_square(x, y)
+        legal_moves = self._get_piece_moves(s) if s is not None else []
 
         # Save the result into legal moves cache.
         if cache:
@@ -276,92 +418,407 @@ class Board:
         '''
         Gets a list of all the legal moves that player of color 'color' could make in
         the current board state.
-        '''
 
-        PAWN_COLOR = BLACK_PAWN if color == 'black' else WHITE_PAWN
-        KING_COLOR = BLACK_KING if color == 'black' else WHITE_KING
+        If 'cache' is set, the moves must continue from the required source of a multi-jump
+        if there is one, and they are kept until the board changes.
+        '''
 
-        legal_moves = []
+        # The cached moves belong to the position with the Zobrist key they were stored with.
+        if cache and self.turn_moves:
+            moves_color, moves_key, legal_moves = self.turn_moves
+            if moves_color == color and moves_key == self.zobrist_key:
+                return list(legal_moves)
 
-        for row in range(8):
-            for col in range(8):
-                if self.state[row][col] == PAWN_COLOR or self.state[row][col] == KING_COLOR:
-                    moves = self.get_legal_moves(col, row, cache=cache)
-                    legal_moves += moves
+        # Without jumps, the compound moves of the turn are the very same steps.
+        if cache and self.turn_sequences:
+            moves_color, moves_key, legal_moves = self.turn_sequences
+            if moves_color == color and moves_key == self.zobrist_key and legal_moves and not legal_moves[0].capture:
+                self.turn_moves = self.turn_sequences
+                return list(legal_moves)
 
         # Capture moves are mandatory when possible.
-        capture_moves = [ m for m in legal_moves if m.capture ]
-        if capture_moves:
-            legal_moves = capture_moves
-
+        jumps = self._get_jump_masks(color)
+        if any(jumps):
             if cache and self.required_src:
-                legal_moves = [ m for m in legal_moves if m.src == self.required_src ]
-                if not legal_moves:
+                required_mask = 1 << coords_to_square(*self.required_src)
+                jumps = [ mask & required_mask for mask in jumps ]
+                if not any(jumps):
                     raise RuntimeError('There are no legal moves that match the required source.')
 
+            legal_moves = list( self._iter_moves(jumps, JUMP_MOVES) )
+        else:
+            legal_moves = list( self._iter_moves(self._get_step_masks(color), STEP_MOVES) )
+
+        if cache:
+            self.turn_moves = (color, self.zobrist_key, legal_moves)
+            return list(legal_moves)
+
         return legal_moves
 
 
+    def get_all_compound_moves(self, color, cache=True):
+        '''
+        Gets a list of all the moves that the player of color 'color' could make to complete
+        the turn in the current board state. These are the same as the ones of
+        get_all_legal_moves(), except that the jumps are complete jump sequences: a piece that
+        jumps keeps jumping while it can, as update() requires, and the whole sequence is a
+        single move. Sequences of one jump are the single jumps themselves.
+
+        If a multi-jump is under way, only the sequences that continue it are listed. If 'cache'
+        is set, the moves are kept until the board changes.
+        '''
+
+        if cache and self.turn_sequences:
+            moves_color, moves_key, legal_moves = self.turn_sequences
+            if moves_color == color and moves_key == self.zobrist_key:
+                return list(legal_moves)
+
+        legal_moves = self.get_jump_sequences(color)
+        if not legal_moves:
+            legal_moves = list( self._iter_moves(self._get_step_masks(color), STEP_MOVES) )
+
+        if cache:
+            self.turn_sequences = (color, self.zobrist_key, legal_moves)
+            return list(legal_moves)
+
+        return legal_moves
+
+
+    def get_jump_sequences(self, color):
+        '''
+        Lists the complete jump sequences available to the player of color 'color', as
+        described in get_all_compound_moves(), or an empty list if there are no jumps.
+        '''
+
+        jumps = self._get_jump_masks(color)
+        if not any(jumps):
+            return []
+
+        if color == 'black':
+            opponent, pawn_directions = self.white, BLACK_PAWN_DIRECTIONS
+        else:
+            opponent, pawn_directions = self.black, WHITE_PAWN_DIRECTIONS
+
+        jumpers = jumps[0] | jumps[1] | jumps[2] | jumps[3]
+        if self.jump_square is not None:
+            jumpers &= 1 << self.jump_square
+
+        occupied  = self.black | self.white
+        sequences = []
+
+        for s in iter_squares(jumpers):
+            self._extend_jumps( s, occupied, opponent, bool((self.kings >> s) & 1), pawn_directions,
+                                (), False, sequences )
+
+        # Multi-jumps are told apart by their position in the list, since different sequences
+        # may share the source and destination squares.
+        code = SEQUENCE_CODE_BASE
+        for move in sequences:
+            if move.code < 0:
+                move.code = code
+                code += 1
+
+        return sequences
+
+
+    def iter_legal_moves(self, color):
+        '''
+        Returns a generator of the legal moves of the player of color 'color', in the same order
+        as get_all_legal_moves(). Jumps are looked for first and, since they are mandatory, are
+        the only moves generated if there are any. Moves are built one at a time as they are
+        requested, so a caller that stops early does not pay for the rest.
+        '''
+
+        jumps = self._get_jump_masks(color)
+        if any(jumps):
+            return self._iter_moves(jumps, JUMP_MOVES)
+
+        return self._iter_moves(self._get_step_masks(color), STEP_MOVES)
+
+
+    def get_legal_move(self, code, color):
+        '''
+        Returns the legal move of the player of color 'color' identified by the given move code,
+        or None if there is no such move.
+        '''
+
+        src, dst = divmod(code, 32)
+
+        own = self.black if color == 'black' else self.white
+        if not (own >> src) & 1:
+            return None
+
+        for move in self._get_piece_moves(src):
+            if move.dst_square == dst:
+                # Steps are not allowed while any jump is available.
+                if not move.capture and any(self._get_jump_masks(color)):
+                    return None
+                return move
+
+        return None
+
+
+    def has_legal_moves(self, color):
+        '''
+        Checks if the player of color 'color' has any move available, without listing them.
+        '''
+
+        return any(self._get_jump_masks(color)) or any(self._get_step_masks(color))
+
+
+    def get_capture_map(self):
+        '''
+        Returns the captures available in the current position for both colors at once, as a
+        (black jumps, white jumps, black threatened, white threatened) tuple. The jumps are the
+        masks of the pieces of that color that can jump along every direction, and the threatened
+        masks hold the pieces of that color that the opponent could capture.
+
+        The map is kept along with the Zobrist key of its position, so the move generation of a
+        search node and the evaluation of that node share it.
+        '''
+
+        if self.capture_map and self.capture_map[0] == self.zobrist_key:
+            return self.capture_map[1]
+
+        black, white = self.black, self.white
+        black_kings  = black & self.kings
+        white_kings  = white & self.kings
+
+        empty = FULL_MASK & ~(black | white)
+
+        black_jumps = [0] * 4
+        white_jumps = [0] * 4
+        black_threatened = 0
+        white_threatened = 0
+
+        for d in range(4):
+            black_movers = black if d in BLACK_PAWN_DIRECTIONS else black_kings
+            white_movers = white if d in WHITE_PAWN_DIRECTIONS else white_kings
+            if not (black_movers or white_movers):
+                continue
+
+            landings = source_mask(empty, JUMP_SHIFTS[d])
+
+            # The captured pieces are the neighbours of the jumping ones along the direction
+            # of the jump, that is the tiles whose neighbour along the opposite one jumps.
+            if black_movers:
+                black_jumps[d] = black_movers & source_mask(white, STEP_SHIFTS[d]) & landings
+                if black_jumps[d]:
+                    white_threatened |= source_mask(black_jumps[d], STEP_SHIFTS[REVERSE_DIRECTIONS[d]])
+
+            if white_movers:
+                white_jumps[d] = white_movers & source_mask(black, STEP_SHIFTS[d]) & landings
+                if white_jumps[d]:
+                    black_threatened |= source_mask(white_jumps[d], STEP_SHIFTS[REVERSE_DIRECTIONS[d]])
+
+        capture_map = ( tuple(black_jumps), tuple(white_jumps), black_threatened, white_threatened )
+        self.capture_map = (self.zobrist_key, capture_map)
+
+        return capture_map
+
+
     def temporary_update(self, move):
         '''
-        Updates the board without showing any changes to the user and produces an undo key
-        to revert the update.
+        Updates the board without showing any changes to the user and pushes an undo key
+        to the undo stack, which is also returned, so that undo_temporary_update() can
+        revert the update.
 
         This function assumes the move provided is legal.
         '''
 
-        undo_key = { 'move': move }
+        if self.undo_count == UNDO_STACK_SIZE:
+            raise RuntimeError('Too many temporary updates to undo, at most {} are supported.'.format(UNDO_STACK_SIZE))
+
+        if self.trace_allocations:
+            traced = self._start_allocation_trace()
+
+        undo_key = self._move_pieces(move)
 
-        # Update location of the moving piece and promote piece if neccesary.
-        self.state[move.dst[1]][move.dst[0]] = self.state[move.src[1]][move.src[0]]
-        self.state[move.src[1]][move.src[0]] = EMPTY
-        if move.promote:
-            self.state[move.dst[1]][move.dst[0]] *= 3
+        if self.color_to_move == 'white':
+            undo_key |= UNDO_WHITE_TO_MOVE
+        if self.jump_square is not None:
+            undo_key |= (self.jump_square + 1) << UNDO_JUMP_SHIFT
 
-        # Remove captured piece if any.
-        if move.capture:
-            delta_x = ( move.src[0] - move.dst[0] ) // 2
-            delta_y = ( move.src[1] - move.dst[1] ) // 2
-            captured_piece = ( move.dst[0] + delta_x, move.dst[1] + delta_y )
-            undo_key['cp_position'] = captured_piece
-            undo_key['cp_type'] = self.state[captured_piece[1]][captured_piece[0]]
-            self.state[captured_piece[1]][captured_piece[0]] = EMPTY
+        self.undo_stack[self.undo_count] = undo_key
+        self.undo_count += 1
+
+        # The same color moves again if the piece can keep jumping.
+        dst = move.dst_square
+        color = 'black' if (self.black >> dst) & 1 else 'white'
+        if move.capture and self._can_jump_from(dst):
+            self._set_turn(color, dst)
+        else:
+            self._set_turn('white' if color == 'black' else 'black', None)
 
         # Check if the game is over.
         if self._is_game_over():
             self.game_over = True
-        
+
+        if self.trace_allocations:
+            self._stop_allocation_trace(traced)
+
+        if self.debug:
+            self._check_incremental_state()
+
         return undo_key
 
 
-    def undo_temporary_update(self, undo_key):
+    def undo_temporary_update(self, undo_key=None):
         '''
-        Reverts a temporary update based on the undo_key provided.
+        Reverts the last temporary update. If an undo key is given, it must be the one of
+        that update.
         '''
 
-        move = undo_key['move']
+        if not self.undo_count:
+            raise RuntimeError('There is no temporary update to undo.')
 
-        # Unpromote piece if there was any promotion.
-        if move.promote:
-            self.state[move.dst[1]][move.dst[0]] //= 3
+        if self.trace_allocations:
+            traced = self._start_allocation_trace()
 
-        # Return displaced piece to its original position.
-        self.state[move.src[1]][move.src[0]] = self.state[move.dst[1]][move.dst[0]]
-        self.state[move.dst[1]][move.dst[0]] = EMPTY
+        key = self.undo_stack[self.undo_count - 1]
 
-        # Return any captured pieces to the board.
-        if move.capture:
-            self.state[ undo_key['cp_position'][1] ][ undo_key['cp_position'][0] ] = undo_key['cp_type']
+        if undo_key is not None and undo_key != key:
+            raise RuntimeError('Temporary updates must be undone in reverse order.')
 
+        self.undo_count -= 1
+
+        dst_bit   = 1 << ( (key >> UNDO_DST_SHIFT) & 31 )
+        own_delta = (1 << (key & 31)) ^ dst_bit
+
+        if key & UNDO_MOVED_KING:
+            kings_delta = own_delta
+        elif key & UNDO_PROMOTED:
+            kings_delta = dst_bit
+        else:
+            kings_delta = 0
+
+        opponent_delta = (key >> UNDO_CAPTURED_SHIFT) & FULL_MASK
+        if opponent_delta:
+            kings_delta ^= key >> UNDO_CAPTURED_KINGS_SHIFT
+
+        if self.black & dst_bit:
+            self._apply_deltas(own_delta, opponent_delta, kings_delta)
+        else:
+            self._apply_deltas(opponent_delta, own_delta, kings_delta)
+
+        jump_square = (key >> UNDO_JUMP_SHIFT) & 63
+        self._set_turn( 'white' if key & UNDO_WHITE_TO_MOVE else 'black', jump_square - 1 if jump_square else None )
         self.game_over = False
 
+        if self.trace_allocations:
+            self._stop_allocation_trace(traced)
+
+        if self.debug:
+            self._check_incremental_state()
+
+
+    def _start_allocation_trace(self):
+        '''
+        Starts measuring the memory allocated by a temporary update or undo, and returns the
+        memory in use at this point.
+        '''
+
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('Tracing the allocations of the board requires tracemalloc to be tracing.')
+
+        if Board.trace_overhead is None:
+            Board.trace_overhead = min( traced_memory_since(traced_memory_mark()) for _ in range(100) )
+
+        return traced_memory_mark()
+
+
+    def _stop_allocation_trace(self, in_use):
+        '''
+        Adds the memory allocated since the matching _start_allocation_trace() call to the
+        allocation counters.
+        '''
+
+        allocated = traced_memory_since(in_use) - self.trace_overhead
+
+        if allocated > 0:
+            self.allocated_bytes    += allocated
+            self.allocating_updates += 1
+        self.traced_updates += 1
+
+
+    def get_allocations_per_update(self):
+        '''
+        Returns the average number of bytes allocated by every temporary update and undo
+        traced so far, and the fraction of them that allocated anything.
+        '''
+
+        if not self.traced_updates:
+            return 0, 0
+
+        return self.allocated_bytes / self.traced_updates, self.allocating_updates / self.traced_updates
+
+
+    def get_position(self):
+        '''
+        Returns the placement of the pieces as a (black, white, kings) tuple of bitboards.
+        '''
+
+        return self.black, self.white, self.kings
+
+
+    def set_position(self, position):
+        '''
+        Places the pieces as given by a tuple returned by get_position. The player in turn
+        and the game state are left unchanged.
+        '''
+
+        self.black, self.white, self.kings = position
+        self._derive_state()
+
+
+    def get_snapshot(self):
+        '''
+        Returns the placement of the pieces along with the color to move and the square a
+        multi-jump must continue from, which is all a search needs to start from this position.
+        '''
+
+        return self.black, self.white, self.kings, self.color_to_move, self.jump_square
+
+
+    def set_snapshot(self, snapshot):
+        '''
+        Restores a position from a tuple returned by get_snapshot. The players are left
+        unchanged and the cached moves are dropped.
+        '''
+
+        black, white, kings, self.color_to_move, self.jump_square = snapshot
+        self.set_position( (black, white, kings) )
+
+        self.legal_moves.clear()
+        self.turn_moves     = None
+        self.turn_sequences = None
+        self.required_src   = None
+        self.game_over      = False
+
+
+    def compute_zobrist_key(self):
+        '''
+        Computes the Zobrist key of the current position from scratch.
+        '''
+
+        key = 0
+        for s in iter_squares(self.black | self.white):
+            key ^= ZOBRIST_PIECE_KEYS[self._get_square_state(s)][s]
+
+        if self.color_to_move == 'white':
+            key ^= ZOBRIST_WHITE_TO_MOVE
+        if self.jump_square is not None:
+            key ^= ZOBRIST_JUMP_KEYS[self.jump_square]
+
+        return key
+
 
     def get_move_features_values(self, move):
         '''
         Makes a temporary move on the board, gets the features of the resulting state,
         and then undoes the temporary move.
         '''
-        
+
         undo_key = self.temporary_update(move)
         values   = self.player_in_turn.compute_features()
         self.undo_temporary_update(undo_key)
@@ -393,26 +850,297 @@ class Board:
         return state
 
 
-    def _get_current_possible_jumps(self):
+    def _set_state(self, state):
         '''
-        Finds all the possible jumps that can be made in the current state of
-        the board if any.
+        Loads the bitboards from an 8x8 grid of tile values.
         '''
 
+        self.black = 0
+        self.white = 0
+        self.kings = 0
+
+        for s, (x, y) in enumerate(SQUARE_COORDS):
+            tile = state[y][x]
+            if tile > 0:
+                self.black |= 1 << s
+            elif tile < 0:
+                self.white |= 1 << s
+
+            if tile == BLACK_KING or tile == WHITE_KING:
+                self.kings |= 1 << s
+
+        self._derive_state()
+
+
+    def _derive_state(self):
+        '''
+        Rebuilds the Zobrist key and the piece counts from the bitboards.
+        '''
+
+        self.zobrist_key  = self.compute_zobrist_key()
+        self.piece_counts = self._recount_pieces()
+
+
+    def _recount_pieces(self):
+        '''
+        Counts the pieces of every kind from scratch.
+        '''
+
+        black_kings = bin(self.black & self.kings).count('1')
+        white_kings = bin(self.white & self.kings).count('1')
+
+        return { BLACK_PAWN : bin(self.black).count('1') - black_kings,
+                 BLACK_KING : black_kings,
+                 WHITE_PAWN : bin(self.white).count('1') - white_kings,
+                 WHITE_KING : white_kings,
+                 EMPTY      : 32 - bin(self.black | self.white).count('1') }
+
+
+    def _set_turn(self, color, jump_square):
+        '''
+        Sets the color to move and the square a multi-jump has to continue from, updating
+        the Zobrist key accordingly.
+        '''
+
+        if (color == 'white') != (self.color_to_move == 'white'):
+            self.zobrist_key ^= ZOBRIST_WHITE_TO_MOVE
+        if self.jump_square is not None:
+            self.zobrist_key ^= ZOBRIST_JUMP_KEYS[self.jump_square]
+        if jump_square is not None:
+            self.zobrist_key ^= ZOBRIST_JUMP_KEYS[jump_square]
+
+        self.color_to_move = color
+        self.jump_square   = jump_square
+
+
+    def _check_incremental_state(self):
+        '''
+        Verifies that the incrementally updated Zobrist key and piece counts match the position.
+        '''
+
+        if self.zobrist_key != self.compute_zobrist_key():
+            raise RuntimeError('Zobrist key out of sync with the board: {}'.format(self))
+
+        if self.piece_counts != self._recount_pieces():
+            raise RuntimeError('Piece counts out of sync with the board: {}'.format(self))
+
+
+    def count_pieces(self, color):
+        '''
+        Returns the number of pieces, kings included, of the given color.
+        '''
+
+        if color == 'black':
+            return self.piece_counts[BLACK_PAWN] + self.piece_counts[BLACK_KING]
+
+        return self.piece_counts[WHITE_PAWN] + self.piece_counts[WHITE_KING]
+
+
+    def _get_square_state(self, s):
+        '''
+        Returns the tile value of the square with bit index 's'.
+        '''
+
+        return tile_value(self.black, self.white, self.kings, 1 << s)
+
+
+    def _get_direction_movers(self, color):
+        '''
+        Returns, for every direction, the mask of pieces of color 'color' allowed to move
+        along it, together with the mask of opponent pieces.
+        '''
+
+        if color == 'black':
+            own, opponent, pawn_directions = self.black, self.white, BLACK_PAWN_DIRECTIONS
+        else:
+            own, opponent, pawn_directions = self.white, self.black, WHITE_PAWN_DIRECTIONS
+
+        # Pawns only move along their forward directions, kings along all of them.
+        kings  = own & self.kings
+        movers = [ own if d in pawn_directions else kings for d in range(4) ]
+
+        return movers, opponent
+
+
+    def _get_jump_masks(self, color):
+        '''
+        Returns, for every direction, the mask of pieces of color 'color' that can jump
+        along it, taken from the capture map.
+        '''
+
+        return self.get_capture_map()[0 if color == 'black' else 1]
+
+
+    def _get_step_masks(self, color):
+        '''
+        Returns, for every direction, the mask of pieces of color 'color' that can move
+        one tile along it.
+        '''
+
+        movers, _ = self._get_direction_movers(color)
+        empty = FULL_MASK & ~(self.black | self.white)
+
+        return [ movers[d] and movers[d] & source_mask(empty, STEP_SHIFTS[d]) for d in range(4) ]
+
+
+    def _iter_moves(self, masks, move_table):
+        '''
+        Yields the moves described by per direction masks of moving pieces, piece by piece in
+        row-major order, taking them from the given table of precomputed moves.
+        '''
+
+        for s in iter_squares(masks[0] | masks[1] | masks[2] | masks[3]):
+            variant = 0 if (self.kings >> s) & 1 else 1
+            for d in range(4):
+                if (masks[d] >> s) & 1:
+                    yield move_table[s][d][variant]
+
+
+    def _get_piece_moves(self, s, jumps_only=False):
+        '''
+        Lists the moves of the piece in the square with bit index 's' by looking up its
+        neighbours in the precomputed tables.
+        '''
+
+        bit = 1 << s
+        if bit & self.black:
+            opponent, directions = self.white, BLACK_PAWN_DIRECTIONS
+        elif bit & self.white:
+            opponent, directions = self.black, WHITE_PAWN_DIRECTIONS
+        else:
+            return []
+
+        # Kings can go in any direction, while pawns can only go forward and may be promoted.
+        variant = 1
+        if bit & self.kings:
+            directions = KING_DIRECTIONS
+            variant    = 0
+
+        occupied = self.black | self.white
+        steps    = STEP_TABLE[s]
+        landings = JUMP_TABLE[s]
+
         legal_moves = []
+        for d in directions:
+            step = steps[d]
+            if step < 0:
+                continue
+
+            if not (occupied >> step) & 1:
+                if not jumps_only:
+                    legal_moves.append( STEP_MOVES[s][d][variant] )
+            elif (opponent >> step) & 1 and landings[d] >= 0 and not (occupied >> landings[d]) & 1:
+                legal_moves.append( JUMP_MOVES[s][d][variant] )
+
+        return legal_moves
+
+
+    def _extend_jumps(self, s, occupied, opponent, king, pawn_directions, hops, promote, sequences):
+        '''
+        Follows every way the piece in the square with bit index 's' can keep jumping, given the
+        masks of the occupied squares and of the opponent pieces that are still on the board,
+        and appends the complete sequences that extend the given jumps to 'sequences'. Captured
+        pieces are removed as they are jumped, and pawns that get promoted go on as kings.
+        '''
+
+        directions = KING_DIRECTIONS if king else pawn_directions
+        variant    = 0 if king else 1
+        steps      = STEP_TABLE[s]
+        landings   = JUMP_TABLE[s]
+        extended   = False
+
+        for d in directions:
+            step, landing = steps[d], landings[d]
+            if landing < 0 or not (opponent >> step) & 1 or (occupied >> landing) & 1:
+                continue
+
+            hop      = JUMP_MOVES[s][d][variant]
+            captured = 1 << step
+            extended = True
+
+            self._extend_jumps( landing, occupied ^ captured ^ (1 << s) ^ (1 << landing), opponent ^ captured,
+                                king or hop.promote, pawn_directions, hops + (hop,), promote or hop.promote,
+                                sequences )
+
+        if not extended and hops:
+            sequences.append( hops[0] if len(hops) == 1 else JumpSequence(hops, promote) )
+
+
+    def _move_pieces(self, move):
+        '''
+        Moves the piece, promotes it if neccesary and removes the captured pieces if any, and
+        returns an undo key with everything but the turn before the move.
+        '''
+
+        # A king may end a multi-jump on the square it started from.
+        src_bit   = 1 << move.src_square
+        dst_bit   = 1 << move.dst_square
+        own_delta = src_bit ^ dst_bit
+
+        undo_key = move.src_square | (move.dst_square << UNDO_DST_SHIFT)
+
+        # Kings carry their flag along, pawns get one when promoted.
+        if self.kings & src_bit:
+            kings_delta = own_delta
+            undo_key   |= UNDO_MOVED_KING
+        elif move.promote:
+            kings_delta = dst_bit
+            undo_key   |= UNDO_PROMOTED
+        else:
+            kings_delta = 0
+
+        # Remove captured pieces if any. The moving piece may land on a square it captured
+        # from, so the king flags are toggled.
+        opponent_delta = move.captured_mask
+        if opponent_delta:
+            captured_kings = self.kings & opponent_delta
+            kings_delta   ^= captured_kings
+            undo_key      |= (opponent_delta << UNDO_CAPTURED_SHIFT) | (captured_kings << UNDO_CAPTURED_KINGS_SHIFT)
+
+        if self.black & src_bit:
+            self._apply_deltas(own_delta, opponent_delta, kings_delta)
+        else:
+            self._apply_deltas(opponent_delta, own_delta, kings_delta)
+
+        return undo_key
+
+
+    def _apply_deltas(self, black_delta, white_delta, kings_delta):
+        '''
+        XORs the masks of the squares changed by a move into the bitboards.
+        '''
+
+        black, white, kings = self.black, self.white, self.kings
+
+        self.black = black ^ black_delta
+        self.white = white ^ white_delta
+        self.kings = kings ^ kings_delta
+
+        # Swap the keys of the tiles that changed and move their pieces between counters.
+        key     = self.zobrist_key
+        counts  = self.piece_counts
+        changed = black_delta | white_delta | kings_delta
+
+        while changed:
+            bit      = changed & -changed
+            changed ^= bit
+            s        = bit.bit_length() - 1
+            old_tile = tile_value(black, white, kings, bit)
+            tile     = tile_value(self.black, self.white, self.kings, bit)
+
+            key ^= ZOBRIST_PIECE_KEYS[old_tile][s] ^ ZOBRIST_PIECE_KEYS[tile][s]
+            counts[old_tile] -= 1
+            counts[tile]     += 1
 
-        PAWN_COLOR = BLACK_PAWN if self.player_in_turn.color == 'black' else WHITE_PAWN
-        KING_COLOR = BLACK_KING if self.player_in_turn.color == 'black' else WHITE_KING
-        
-        for row in range(8):
-            for col in range(8):
-                if self.state[row][col] == PAWN_COLOR or self.state[row][col] == KING_COLOR:
-                    legal_moves += self.get_legal_moves(col, row)
+        self.zobrist_key = key
 
-        # Return only jumps if any.
-        possible_jumps = [ x for x in legal_moves if x.capture ]
 
-        return possible_jumps
+    def _can_jump_from(self, s):
+        '''
+        Checks if the piece in the square with bit index 's' has any jump available.
+        '''
+
+        return bool( self._get_piece_moves(s, jumps_only=True) )
 
 
     def _is_game_over(self):
@@ -421,16 +1149,9 @@ class Board:
         current player.
         '''
 
-        PAWN_COLOR = BLACK_PAWN if self.player_in_turn.color == 'white' else WHITE_PAWN
-        KING_COLOR = BLACK_KING if self.player_in_turn.color == 'white' else WHITE_KING
+        opponent = 'black' if self.player_in_turn.color == 'white' else 'white'
 
-        piece_found = False
-        for row in range(8):
-            for col in range(8):
-                if self.state[row][col] == PAWN_COLOR or self.state[row][col] == KING_COLOR:
-                    piece_found = True
-
-        return not piece_found
+        return self.count_pieces(opponent) == 0
 
 
 
@@ -442,21 +1163,127 @@ class Move:
 
     This class represents the basic information of a move in the
     game of Checkers.
+
+    Besides the coordinates, moves carry the bit indexes of their squares ('captured' is
+    -1 when nothing is captured), the tuple and the mask of the captured squares and 'code',
+    an integer that identifies the move by its source and destination squares. The moves
+    produced by the board are shared instances taken from precomputed tables, so they must
+    not be modified.
     '''
 
+    __slots__ = ( 'src', 'dst', 'capture', 'promote', 'src_square', 'dst_square', 'captured', 'captures',
+                  'captured_mask', 'code' )
+
     def __init__(self, src, dst, capture=False, promote=False):
         self.src = src
         self.dst = dst
         self.capture = capture
         self.promote = promote
 
+        self.src_square = coords_to_square(*src)
+        self.dst_square = coords_to_square(*dst)
+        self.captured   = -1
+        self.code       = -1
+
+        self.captures      = ()
+        self.captured_mask = 0
+
+        if self.src_square is not None and self.dst_square is not None:
+            self.code = self.src_square * 32 + self.dst_square
+            if capture:
+                self.captured      = coords_to_square( (src[0] + dst[0]) // 2, (src[1] + dst[1]) // 2 )
+                self.captures      = (self.captured,)
+                self.captured_mask = 1 << self.captured
+
 
     def __str__(self):
         return 'Move(src={}, dst={}, capture={}, promote={})'.format( self.src,
-                                                                      self.dst, 
-                                                                      self.capture, 
+                                                                      self.dst,
+                                                                      self.capture,
                                                                       self.promote )
 
 
     def __eq__(self, other):
         return ( self.src == other.src and self.dst == other.dst )
+
+
+
+class JumpSequence(Move):
+    '''
+    Jump sequence object representation.
+
+    This class represents a complete multi-jump, made of two or more single jumps of the same
+    piece, as a single move that is made and undone at once. It goes from the source of the
+    first jump to the destination of the last one, captures every piece in 'captures' and is
+    a promotion if any of its jumps is. Its 'code' only identifies it among the moves of the
+    position it was generated for.
+    '''
+
+    __slots__ = ('hops',)
+
+    def __init__(self, hops, promote=False):
+        first, last = hops[0], hops[-1]
+
+        self.src     = first.src
+        self.dst     = last.dst
+        self.capture = True
+        self.promote = promote
+        self.hops    = hops
+
+        self.src_square = first.src_square
+        self.dst_square = last.dst_square
+        self.captured   = -1
+        self.code       = -1
+
+        self.captures      = tuple( hop.captured for hop in hops )
+        self.captured_mask = 0
+        for s in self.captures:
+            self.captured_mask |= 1 << s
+
+
+    def __str__(self):
+        return 'JumpSequence(path={}, promote={})'.format( [self.src] + [ hop.dst for hop in self.hops ],
+                                                           self.promote )
+
+
+    def __eq__(self, other):
+        # Single moves compare against sequences through this method too.
+        return isinstance(other, JumpSequence) and self.hops == other.hops
+
+
+
+####### MOVE TABLES #######
+
+def _build_move_table(square_table, capture):
+    '''
+    Builds the moves along every direction of every square, using the destinations of the
+    given square table. Each entry is a (king move, pawn move) pair, which only differ when
+    a pawn moving along that direction gets promoted.
+    '''
+
+    table = []
+    for s in range(32):
+        moves = []
+        for d, (_, dy) in enumerate(DIRECTIONS):
+            dst = square_table[s][d]
+            if dst < 0:
+                moves.append(None)
+                continue
+
+            src_coords = list(SQUARE_COORDS[s])
+            dst_coords = list(SQUARE_COORDS[dst])
+            king_move  = Move(src_coords, dst_coords, capture=capture)
+
+            promotes = BLACK_PROMOTION_SQUARES[dst] if dy > 0 else WHITE_PROMOTION_SQUARES[dst]
+            if promotes:
+                moves.append( (king_move, Move(src_coords, dst_coords, capture=capture, promote=True)) )
+            else:
+                moves.append( (king_move, king_move) )
+
+        table.append( tuple(moves) )
+
+    return tuple(table)
+
+
+STEP_MOVES = _build_move_table(STEP_TABLE, capture=False)
+JUMP_MOVES = _build_move_table(JUMP_TABLE, capture=True)
@@ -1,8 +1,11 @@
 import os
+import time
+import queue
 import logging
-from collections import deque
+import multiprocessing
+from collections import deque, Counter
 
-from checkersml import board, player, features
+from checkersml import board, player, features, model, selfplay, paramserver, simulator
 from checkersgui import CheckersSwingGUI
 
 import sys
@@ -19,11 +22,18 @@ class CheckersController:
     player model by having it play against itself or to provide regular game functionality.
     '''
 
-    def __init__(self, no_train=False, no_data=False):
+    def __init__(self, no_train=False, no_data=False, move_time=None, search_processes=0):
 
         self.logger   = logging.getLogger()
         self.no_train = no_train
         self.no_data  = no_data
+
+        # With a time per move the searching players use iterative deepening with no fixed depth.
+        self.move_time    = move_time
+        self.search_depth = 0 if move_time else 3
+
+        # Number of processes the ML Player splits the root moves among in real games.
+        self.search_processes = search_processes
         
 
     def play(self, real_players):
@@ -36,14 +46,16 @@ class CheckersController:
         b = board.Board()
 
         if real_players == 0:
-            black_player = player.LinearModelPlayer('black', b, train    = True,
-                                                           learning_rate = 0.01,
-                                                           reg_const     = 0,
-                                                           lambda_const  = 0.7,
-                                                           search_depth  = 3,
-                                                           epsilon       = 0.05,
-                                                           save_file     = 'pickled_models/model1.pickle',
-                                                           no_records    = self.no_data)
+            black_player = player.LinearModelPlayer('black', b, train            = True,
+                                                           learning_rate    = 0.01,
+                                                           reg_const        = 0,
+                                                           lambda_const     = 0.7,
+                                                           search_depth     = self.search_depth,
+                                                           epsilon          = 0.05,
+                                                           save_file        = 'pickled_models/model1.pickle',
+                                                           no_records       = self.no_data,
+                                                           time_budget      = self.move_time,
+                                                           search_processes = self.search_processes)
 
             white_player = player.LinearModelPlayer('white', b, train    = False,
                                                            learning_rate = 0,
@@ -55,14 +67,16 @@ class CheckersController:
                                                            no_records    = self.no_data)
 
         elif real_players == 1:
-            black_player = player.LinearModelPlayer('black', b, train    = True,
-                                                           learning_rate = 0.01,
-                                                           reg_const     = 0,
-                                                           lambda_const  = 0.7,
-                                                           search_depth  = 3,
-                                                           epsilon       = 0.05,
-                                                           save_file     = 'pickled_models/model1.pickle',
-                                                           no_records    = self.no_data)
+            black_player = player.LinearModelPlayer('black', b, train            = True,
+                                                           learning_rate    = 0.01,
+                                                           reg_const        = 0,
+                                                           lambda_const     = 0.7,
+                                                           search_depth     = self.search_depth,
+                                                           epsilon          = 0.05,
+                                                           save_file        = 'pickled_models/model1.pickle',
+                                                           no_records       = self.no_data,
+                                                           time_budget      = self.move_time,
+                                                           search_processes = self.search_processes)
 
             white_player = player.RealPlayer('white', b)
 
@@ -130,6 +144,8 @@ class CheckersController:
                         if isinstance(p, player.MLPlayer) and p.train:
                             p.save_model()
                             p.reset()
+                        if isinstance(p, player.MLPlayer):
+                            p.close()
 
                     gui.exit()
                     sys.exit(0)
@@ -149,10 +165,11 @@ class CheckersController:
                                                             learning_rate = 0.01,
                                                             reg_const     = 0,
                                                             lambda_const  = 0.7,
-                                                            search_depth  = 3,
+                                                            search_depth  = self.search_depth,
                                                             epsilon       = 0.05,
                                                             save_file     = 'pickled_models/model1.pickle',
-                                                            no_records    = self.no_data)
+                                                            no_records    = self.no_data,
+                                                            time_budget   = self.move_time)
 
         white_player = player.LinearModelPlayer('white', b, train         = False,
                                                             learning_rate = 0,
@@ -169,6 +186,7 @@ class CheckersController:
         
         curr_cycle    = 1
         cycle_outcome = None
+        turn_count    = 0
 
         trainee_wins  = 0
         trainee_ties  = 0
@@ -180,38 +198,16 @@ class CheckersController:
 
             try:
 
-                turn_count = 0
-
-                while(not b.game_over):
+                cycle_outcome, turn_count = selfplay.play_game(b, trainee, other_player)
 
-                    turn_count += 1
-
-                    move = b.player_in_turn.make_move()
-
-                    # It is illegal to pass turn in Checkers.
-                    if not move:
-                        raise ValueError("Player didn't pick a move.")
-
-                    try:
-                        b.update(move)
-                    except ValueError:
-                        pass
-
-                    if b.game_over:
-                        if b.game_over < 3:
-                            if b.player_in_turn.color == trainee.color:
-                                trainee_wins += 1
-                                cycle_outcome = 'Win'
-                                other_player.update_loss()
-                            else:
-                                trainee_loses += 1
-                                cycle_outcome = 'Loss'
-                                trainee.update_loss()
-                        elif b.game_over == 3:
-                            trainee_ties += 1
-                            cycle_outcome = 'Tie'
+                if cycle_outcome == 'Win':
+                    trainee_wins += 1
+                elif cycle_outcome == 'Loss':
+                    trainee_loses += 1
+                else:
+                    trainee_ties += 1
 
-                        total_turns += turn_count
+                total_turns += turn_count
 
                 self.print_info( curr_cycle, cycle_outcome, turn_count, total_turns, trainee, trainee_wins, trainee_ties,
                                  trainee_loses )
@@ -227,11 +223,6 @@ class CheckersController:
                     self.logger.info('Final trainee win rate: {:.2%}'.format(trainee_wins/max_cycles))
                     sys.exit(0)
 
-                # Reset the board values on every cycle.
-                b.__init__()
-                b.set_players(black_player, white_player)
-                trainee.reset()
-
             except KeyboardInterrupt:
                 for p in [black_player, white_player]:
                     if p.train:
@@ -248,9 +239,294 @@ class CheckersController:
                 sys.exit(0)
                 
 
-    def print_info(self, cycle, outcome, turn_count, total_turns, trainee, trainee_wins, trainee_ties, trainee_loses):
+    def train_parallel(self, max_cycles, workers):
+        '''
+        Trains a machine learning model like train(), but the games are played by 'workers' actor
+        processes with copies of the model. The actors send the trajectories of their games back
+        to this process, which learns from them with TD(lambda) and publishes the new weights to
+        a shared memory block after every game, where the actors pick them up before each move.
+        The 'max_cycles' argument works as in train().
+        '''
+
+        b = board.Board()
+
+        trainee = player.LinearModelPlayer('black', b, train         = True,
+                                                       learning_rate = 0.01,
+                                                       reg_const     = 0,
+                                                       lambda_const  = 0.7,
+                                                       search_depth  = self.search_depth,
+                                                       epsilon       = 0.05,
+                                                       save_file     = 'pickled_models/model1.pickle',
+                                                       no_records    = self.no_data,
+                                                       time_budget   = self.move_time)
+
+        trainee_config, opponent_config = self.get_actor_configs()
+
+        results           = multiprocessing.Queue()
+        shared_parameters = model.SharedParameters(trainee.model)
+        actors            = [ selfplay.SelfPlayActor(i, trainee_config, opponent_config, shared_parameters, results)
+                              for i in range(workers) ]
+
+        processes = [ multiprocessing.Process(target=actor.run, daemon=True) for actor in actors ]
+        for process in processes:
+            process.start()
+
+        try:
+            worker_games, elapsed = self.learn_from_actors( trainee, results, shared_parameters.publish,
+                                                            Counter({ i: 0 for i in range(workers) }), max_cycles )
+        finally:
+            self.stop_actors(actors, processes, results)
+            shared_parameters.close()
+
+        if sum(worker_games.values()):
+            self.print_worker_info(worker_games, elapsed)
+        else:
+            print('No cycles were completed.')
+
+        sys.exit(0)
+
+
+    def train_server(self, max_cycles, address, workers=0):
+        '''
+        Trains a machine learning model like train_parallel(), but the actors may play on any
+        machine. They pull the weights from a parameter server listening on 'address', a
+        (host, port) pair, and push the trajectories of their games to it. Actors are started
+        with join_training(). Another 'workers' actor processes are started on this machine,
+        which connect to the server just like remote ones, so that the whole setup can also run
+        on a single machine. The 'max_cycles' argument works as in train().
+        '''
+
+        b = board.Board()
+
+        trainee = player.LinearModelPlayer('black', b, train         = True,
+                                                       learning_rate = 0.01,
+                                                       reg_const     = 0,
+                                                       lambda_const  = 0.7,
+                                                       search_depth  = self.search_depth,
+                                                       epsilon       = 0.05,
+                                                       save_file     = 'pickled_models/model1.pickle',
+                                                       no_records    = self.no_data,
+                                                       time_budget   = self.move_time)
+
+        server = paramserver.ParameterServer(address, trainee.model)
+
+        # The local actors reach the server through the loopback interface unless it only
+        # listens on another one.
+        host, port = server.server_address
+        if host in ('', '0.0.0.0'):
+            host = 'localhost'
+
+        actors    = [ paramserver.RemoteActor( (host, port), *self.get_actor_configs() ) for _ in range(workers) ]
+        processes = [ multiprocessing.Process(target=actor.run, daemon=True) for actor in actors ]
+        for process in processes:
+            process.start()
+
+        server.start()
+        self.logger.info( 'Serving the model weights on port {}.'.format(port) )
+
+        try:
+            worker_games, elapsed = self.learn_from_actors(trainee, server.trajectories, server.publish, Counter(), max_cycles)
+        finally:
+            # The actors stop once they push the game they are playing.
+            server.stop()
+            for process in processes:
+                process.join()
+            server.close()
+
+        self.logger.info( 'Stale games dropped: {}'.format(server.stale_games) )
+        self.logger.info( 'Malformed games rejected: {}'.format(server.rejected_games) )
+        self.logger.info( 'Games held back while the learner was busy: {}'.format(server.busy_replies) )
+
+        if sum(worker_games.values()):
+            self.print_worker_info(worker_games, elapsed)
+        else:
+            print('No cycles were completed.')
+
+        sys.exit(0)
+
+
+    def join_training(self, address):
+        '''
+        Plays training games for the learner serving its model weights at 'address', a
+        (host, port) pair, until it stops.
+        '''
+
+        actor = paramserver.RemoteActor( address, *self.get_actor_configs() )
+
+        self.logger.info( 'Playing training games for the learner at {}:{}.'.format(*address) )
+        actor.run()
+
+        self.logger.info( 'Games played: {}'.format(actor.games_played) )
+        self.logger.info( 'Stale games dropped: {}'.format(actor.stale_games) )
+        self.logger.info( 'Games rejected by the learner: {}'.format(actor.rejected_games) )
+        self.logger.info( 'Times the learner was busy: {}'.format(actor.busy_replies) )
+        self.logger.info( 'Times the connection was made again: {}'.format(actor.reconnects) )
+
+        sys.exit(0)
+
+
+    def simulate(self, games):
         '''
-        Prints the information gathered after a cycle of training.
+        Plays 'games' games at once with the batch simulator, the trainee against the random
+        player, and reports how many positions per second are played. The trainee picks its
+        moves by the score of the position they lead to instead of searching.
+        '''
+
+        b = board.Board()
+        trainee_config, _ = self.get_actor_configs()
+        trainee = player.LinearModelPlayer('black', b, **trainee_config)
+
+        sim = simulator.BatchSimulator(games)
+        sim.set_policy(trainee.color, trainee.model.coefs_, trainee.epsilon)
+
+        start     = time.time()
+        positions = sim.run()
+        elapsed   = time.time() - start
+
+        wins   = np.count_nonzero( (sim.game_over < simulator.TIE) & (sim.winner == 0) )
+        losses = np.count_nonzero( (sim.game_over < simulator.TIE) & (sim.winner == 1) )
+
+        self.logger.info( 'Simulated {} games in {:.2f}s:'.format(games, elapsed) )
+        self.logger.info( '   Positions: {:>8} {:>10.0f} positions/sec'.format(positions, positions/elapsed) )
+        self.logger.info( '   Average turns per match: {:.2f}'.format( sim.turn_count.mean() ) )
+        self.logger.info( '   Trainee wins: {}, ties: {}, losses: {}'.format(wins, games - wins - losses, losses) )
+
+        sys.exit(0)
+
+
+    def get_actor_configs(self):
+        '''
+        Returns the keyword arguments of the trainee and the opponent players of the self-play
+        actors.
+        '''
+
+        # The actors only play, so their copies of the trainee keep no records.
+        trainee_config  = dict( train         = True,
+                                learning_rate = 0.01,
+                                reg_const     = 0,
+                                lambda_const  = 0.7,
+                                search_depth  = self.search_depth,
+                                epsilon       = 0.05,
+                                save_file     = 'pickled_models/model1.pickle',
+                                no_records    = True,
+                                time_budget   = self.move_time )
+
+        opponent_config = dict( train         = False,
+                                learning_rate = 0,
+                                reg_const     = 0,
+                                lambda_const  = 0,
+                                search_depth  = 0,
+                                epsilon       = 1,
+                                save_file     = 'pickled_models/zeros.pickle',
+                                no_records    = True )
+
+        return trainee_config, opponent_config
+
+
+    def learn_from_actors(self, trainee, results, publish, worker_games, max_cycles):
+        '''
+        Learns from the games that actors send through the 'results' queue as GAME_PLAYED
+        messages, until 'max_cycles' games are learned, which works as in train(), or training
+        is stopped manually. The new weights are handed to the actors by calling 'publish' with
+        the model after every game. The games learned from every actor are counted by its id in
+        'worker_games', which is returned along with the time it took.
+        '''
+
+        curr_cycle    = 1
+        cycle_outcome = None
+        turn_count    = 0
+
+        trainee_wins  = 0
+        trainee_ties  = 0
+        trainee_loses = 0
+
+        total_turns  = 0
+        start        = time.perf_counter()
+
+        try:
+
+            while not max_cycles or curr_cycle <= max_cycles:
+
+                message = results.get()
+                if message[0] != selfplay.GAME_PLAYED:
+                    continue
+
+                _, worker_id, version, cycle_outcome, turn_count, elapsed, scores, feature_values = message
+
+                trainee.learn_trajectory( [ player.State(score, values) for score, values in zip(scores, feature_values) ] )
+                publish(trainee.model)
+
+                if cycle_outcome == 'Win':
+                    trainee_wins += 1
+                elif cycle_outcome == 'Loss':
+                    trainee_loses += 1
+                else:
+                    trainee_ties += 1
+
+                total_turns += turn_count
+                worker_games[worker_id] += 1
+
+                self.print_info( curr_cycle, cycle_outcome, turn_count, total_turns, trainee, trainee_wins, trainee_ties,
+                                 trainee_loses, search_stats=False )
+
+                # Report the throughput once per round of games of the actors.
+                if curr_cycle % len(worker_games) == 0 and curr_cycle != max_cycles:
+                    self.print_worker_info(worker_games, time.perf_counter() - start)
+
+                trainee.reset()
+                curr_cycle += 1
+
+            if max_cycles:
+                self.logger.info('Final trainee win rate: {:.2%}'.format(trainee_wins/max_cycles))
+
+        except KeyboardInterrupt:
+            self.logger.info( 'Training simulation ended manually.' )
+
+        finally:
+            elapsed = time.perf_counter() - start
+            trainee.save_model()
+
+        return worker_games, elapsed
+
+
+    def stop_actors(self, actors, processes, results):
+        '''
+        Asks the actors to stop and waits for them, discarding the games they finish meanwhile.
+        '''
+
+        for actor in actors:
+            actor.stop()
+
+        # The actors cannot exit before the results they sent have been read.
+        while any( process.is_alive() for process in processes ):
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        for process in processes:
+            process.join()
+
+
+    def print_worker_info(self, worker_games, elapsed):
+        '''
+        Prints the number of games played by each actor and the rate at which they play them.
+        '''
+
+        self.logger.info( 'Actor throughput after {:.1f}s:'.format(elapsed) )
+        for worker_id, games in sorted(worker_games.items()):
+            self.logger.info( '   Actor {}: {:>6} games {:>8.3f} games/sec'.format(worker_id, games, games/elapsed) )
+
+        total_games = sum(worker_games.values())
+        self.logger.info( '   Total:   {:>6} games {:>8.3f} games/sec\n'.format(total_games, total_games/elapsed) )
+
+
+    def print_info(self, cycle, outcome, turn_count, total_turns, trainee, trainee_wins, trainee_ties, trainee_loses,
+                   search_stats=True):
+        '''
+        Prints the information gathered after a cycle of training. The statistics of the search
+        of the trainee are left out unless 'search_stats' is set, since a learner that only learns
+        from the games of actors never searches.
         '''
 
         self.logger.info( '---------------------------------------------------------------------------------------------' )
@@ -278,4 +554,33 @@ class CheckersController:
         self.logger.info( 'Trainee win rate:  {:>8.2%} [{}/{}]'.format( trainee_wins/cycle, trainee_wins, cycle ) )
         self.logger.info( 'Trainee tie rate:  {:>8.2%} [{}/{}]'.format( trainee_ties/cycle, trainee_ties, cycle ) )
         self.logger.info( 'Trainee lose rate: {:>8.2%} [{}/{}]'.format (trainee_loses/cycle, trainee_loses, cycle ) )
+
+        if search_stats:
+            self.print_search_info(trainee)
+
         self.logger.info( '---------------------------------------------------------------------------------------------\n' )
+
+
+    def print_search_info(self, trainee):
+        '''
+        Prints the statistics of the searches of the trainee.
+        '''
+
+        orderer = trainee.move_orderer
+        self.logger.info( 'First-move cutoff rate: {:>8.2%} [{}/{}]'.format( orderer.get_first_move_cutoff_rate(),
+                                                                             orderer.first_move_cutoffs, orderer.cutoffs ) )
+        self.logger.info( 'Null window re-search rate: {:>8.2%} [{}/{}]'.format( trainee.get_null_window_failure_rate(),
+                                                                                 trainee.null_window_failures,
+                                                                                 trainee.null_window_searches ) )
+        self.logger.info( 'Aspiration re-search rate:  {:>8.2%} [{}/{}]'.format( trainee.get_aspiration_failure_rate(),
+                                                                                 trainee.aspiration_failures,
+                                                                                 trainee.aspiration_searches ) )
+
+        if board.Board.trace_allocations:
+            b = trainee.board
+            allocated, allocating = b.get_allocations_per_update()
+            self.logger.info( 'Bytes allocated per board update: {:.1f} [{:.2%} of {} updates allocate]'.format( allocated, allocating,
+                                                                                                                 b.traced_updates ) )
+            allocated, allocating = trainee.get_allocations_per_node()
+            self.logger.info( 'Bytes allocated per search node: {:.1f} [{:.2%} of {} nodes allocate]'.format( allocated, allocating,
+                                                                                                              trainee.traced_nodes ) )
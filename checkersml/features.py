@@ -1,3 +1,4 @@
+import numpy as np
 from abc import ABC, abstractmethod
 
 from . import board
@@ -30,13 +31,7 @@ class WhitePiecesFeature(Feature):
 
     
     def compute_value(self, b):
-        value = 0
-        for row in b.state:
-            for tile in row:
-                if tile < 0:
-                    value += 1
-
-        return value/12
+        return (b.piece_counts[board.WHITE_PAWN] + b.piece_counts[board.WHITE_KING]) / 12
 
 
 
@@ -50,13 +45,7 @@ class BlackPiecesFeature(Feature):
 
     
     def compute_value(self, b):
-        value = 0
-        for row in b.state:
-            for tile in row:
-                if tile > 0:
-                    value += 1
-
-        return value/12
+        return (b.piece_counts[board.BLACK_PAWN] + b.piece_counts[board.BLACK_KING]) / 12
 
 
 
@@ -70,13 +59,7 @@ class WhiteKingsFeature(Feature):
 
     
     def compute_value(self, b):
-        value = 0
-        for row in b.state:
-            for tile in row:
-                if tile == board.WHITE_KING:
-                    value += 1
-
-        return value/12
+        return b.piece_counts[board.WHITE_KING] / 12
 
 
 
@@ -90,13 +73,7 @@ class BlackKingsFeature(Feature):
 
     
     def compute_value(self, b):
-        value = 0
-        for row in b.state:
-            for tile in row:
-                if tile == board.BLACK_KING:
-                    value += 1
-
-        return value/12
+        return b.piece_counts[board.BLACK_KING] / 12
 
 
 
@@ -110,18 +87,7 @@ class WhiteThreatenedFeature(Feature):
 
     
     def compute_value(self, b):
-
-        threatened_pieces = set()
-        legal_moves = b.get_all_legal_moves('black', cache=False) 
-        
-        for move in legal_moves:
-            if move.capture:
-                delta_x = ( move.src[0] - move.dst[0] ) // 2
-                delta_y = ( move.src[1] - move.dst[1] ) // 2
-                threatened_piece = ( move.dst[0] + delta_x, move.dst[1] + delta_y )
-                threatened_pieces.add(threatened_piece)
-
-        return len(threatened_pieces)/12
+        return bin( b.get_capture_map()[3] ).count('1') / 12
 
 
 
@@ -135,17 +101,7 @@ class BlackThreatenedFeature(Feature):
 
     
     def compute_value(self, b):
-        threatened_pieces = set()
-        legal_moves = b.get_all_legal_moves('white', cache=False) 
-        
-        for move in legal_moves:
-            if move.capture:
-                delta_x = ( move.src[0] - move.dst[0] ) // 2
-                delta_y = ( move.src[1] - move.dst[1] ) // 2
-                threatened_piece = ( move.dst[0] + delta_x, move.dst[1] + delta_y )
-                threatened_pieces.add(threatened_piece)
-
-        return len(threatened_pieces)/12
+        return bin( b.get_capture_map()[2] ).count('1') / 12
 
 
 
@@ -180,3 +136,126 @@ class PositionValueFeature(Feature):
 
     def compute_value(self, b):
         return self.value_map[ b.state[self.row][self.col] ]
+
+
+
+class VectorizedFeatureExtractor:
+    '''
+    Vectorized feature extractor class
+
+    Computes the whole feature vector of a player with a handful of NumPy operations over the
+    board given as an np.int8 array of tile values, either as an 8x8 grid indexed as [y][x] like
+    board.state or as a vector of the 32 playable squares in bitboard order, or over a stack of
+    such arrays. The features are in the order used by the LinearModelPlayer of the given color:
+    the piece counts, the king counts and the threatened pieces of the player and then of the
+    opponent, followed by the position values of the playable squares. The Feature classes
+    remain the reference implementation.
+    '''
+
+    # Tile value of the extra square that stands for the tiles off the board.
+    OFF_BOARD = 127
+
+    def __init__(self, color):
+
+        self.color = color
+
+        if color == 'black':
+            squares = [ (col, row) for col in range(8) for row in range(8) ]
+        else:
+            squares = [ (col, row) for col in reversed(range(8)) for row in reversed(range(8)) ]
+
+        self.position_squares = np.array([ board.coords_to_square(col, row) for col, row in squares
+                                           if (col + row) % 2 == 0 ])
+
+        # Position values indexed by tile value + 3.
+        value_map = PositionValueFeature(0, 0, color).value_map
+        self.position_values = np.array([ value_map.get(tile, 0) for tile in range(-3, 4) ])
+
+        self.grid_rows = np.array([ y for x, y in board.SQUARE_COORDS ])
+        self.grid_cols = np.array([ x for x, y in board.SQUARE_COORDS ])
+
+        # A piece on square 's' can be captured along direction 'd' by a piece on the square
+        # attackers[s][d] that jumps to landings[s][d]. Tiles off the board are square 32.
+        reverse = board.REVERSE_DIRECTIONS
+        table   = [ [ 32 if t == -1 else t for t in row ] for row in board.STEP_TABLE ]
+
+        self.attackers = np.array([ [ table[s][reverse[d]] for d in range(4) ] for s in range(32) ])
+        self.landings  = np.array(table)
+
+        self.black_pawn_directions = np.isin(np.arange(4), board.BLACK_PAWN_DIRECTIONS)
+        self.white_pawn_directions = np.isin(np.arange(4), board.WHITE_PAWN_DIRECTIONS)
+
+
+    @staticmethod
+    def board_to_array(b):
+        '''
+        Returns the board state as an 8x8 np.int8 array.
+        '''
+
+        return np.array(b.state, dtype=np.int8)
+
+
+    @staticmethod
+    def positions_to_arrays(positions):
+        '''
+        Returns an (N, 32) np.int8 array with the tile values of a list of positions given as
+        returned by board.get_position().
+        '''
+
+        masks = np.array(positions, dtype=np.int64).reshape(-1, 3, 1)
+        bits  = ( (masks >> np.arange(32)) & 1 ).astype(np.int8)
+
+        return (bits[:, 0] - bits[:, 1]) * (1 + 2 * bits[:, 2])
+
+
+    def extract(self, tiles):
+        '''
+        Returns the feature vector of a board array, or one row of features for each board of a
+        stack of board arrays.
+        '''
+
+        tiles = np.asarray(tiles, dtype=np.int8)
+        if tiles.shape[-2:] == (8, 8):
+            tiles = tiles[..., self.grid_rows, self.grid_cols]
+
+        black_pieces = np.count_nonzero(tiles > 0, axis=-1) / 12
+        white_pieces = np.count_nonzero(tiles < 0, axis=-1) / 12
+        black_kings  = np.count_nonzero(tiles == board.BLACK_KING, axis=-1) / 12
+        white_kings  = np.count_nonzero(tiles == board.WHITE_KING, axis=-1) / 12
+
+        # Black pieces are threatened by the white jumps and white pieces by the black ones.
+        black_threatened, white_threatened = self.count_threatened(tiles)
+        black_threatened = black_threatened / 12
+        white_threatened = white_threatened / 12
+
+        if self.color == 'black':
+            counts = ( black_pieces, white_pieces, black_kings, white_kings, black_threatened, white_threatened )
+        else:
+            counts = ( white_pieces, black_pieces, white_kings, black_kings, white_threatened, black_threatened )
+
+        positions = self.position_values[ tiles[..., self.position_squares] + 3 ]
+
+        return np.concatenate( (np.stack(counts, axis=-1), positions), axis=-1 )
+
+
+    def count_threatened(self, tiles):
+        '''
+        Counts the black and the white pieces that the opponent could capture on a vector of 32
+        tile values or on a stack of them.
+        '''
+
+        off_board = np.full(tiles.shape[:-1] + (1,), self.OFF_BOARD, dtype=np.int8)
+        padded    = np.concatenate( (tiles, off_board), axis=-1 )
+
+        attackers = padded[..., self.attackers]
+        landing   = padded[..., self.landings] == board.EMPTY
+
+        black_jumps = ( (attackers == board.BLACK_KING) |
+                        ((attackers == board.BLACK_PAWN) & self.black_pawn_directions) ) & landing
+        white_jumps = ( (attackers == board.WHITE_KING) |
+                        ((attackers == board.WHITE_PAWN) & self.white_pawn_directions) ) & landing
+
+        black_threatened = np.count_nonzero( white_jumps.any(axis=-1) & (tiles > 0), axis=-1 )
+        white_threatened = np.count_nonzero( black_jumps.any(axis=-1) & (tiles < 0), axis=-1 )
+
+        return black_threatened, white_threatened
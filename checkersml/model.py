@@ -1,5 +1,13 @@
+import time
+
 import numpy as np
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
 class LinearRegressionModel:
     '''
     Linear Regression Model class
@@ -8,6 +16,13 @@ class LinearRegressionModel:
     using stochastic gradient descent to allow online machine learning applications.
     '''
 
+    # Counter increased every time the coefficients change, so that anything computed
+    # with older weights can be told apart.
+    version = 0
+
+    # Names of the arrays that hold the model weights.
+    parameters = ('coefs_',)
+
     def __init__(self, dimension, learning_rate, alpha, lambda_const):
         
         self.dimension     = dimension
@@ -49,6 +64,8 @@ class LinearRegressionModel:
             delta = curr_y - pred_score
             self.coefs_ = self.coefs_ + ( self.learning_rate * ((delta * curr_x) - (self.alpha * self.coefs_)) )
 
+        self.version += 1
+
 
     def td_lambda(self, prev_state, next_state):
         '''
@@ -62,3 +79,162 @@ class LinearRegressionModel:
         delta = next_state.score - prev_state.score
         self.eleg_traces = (self.lambda_const * self.eleg_traces) + prev_state.features
         self.coefs_ = self.coefs_ + ( delta * self.eleg_traces * self.learning_rate )
+        self.version += 1
+
+
+
+class SharedParameters:
+    '''
+    Shared parameters class
+
+    Keeps the weight arrays of a model, the ones named in its 'parameters' attribute, in a
+    multiprocessing.shared_memory block along with the version of the model they belong to,
+    so that any number of processes can pick up the latest weights without pickling the model.
+    The block is created from a model by the single process that updates it, and the object can
+    be inherited by forked processes or pickled to attach to the block from any other process.
+
+    Reads are made consistent with a sequence counter, like a seqlock: the writer makes it odd
+    before changing the block and even again when done, and readers retry whenever the counter
+    was odd or changed while they copied the weights out of the block.
+    '''
+
+    # The block starts with the sequence counter and the model version.
+    HEADER_SIZE = 2
+
+    # Seconds that readers wait before checking again a block that is being published.
+    READ_BACKOFF = 0.00005
+
+    def __init__(self, model):
+
+        if shared_memory is None:
+            raise RuntimeError('Shared parameters require Python 3.8 or higher.')
+
+        self.layout = [ (name, getattr(model, name).shape, getattr(model, name).dtype.str) for name in model.parameters ]
+        self.shared = shared_memory.SharedMemory(create=True, size=self._get_size(self.layout))
+        self.owner  = True
+
+        self._map_arrays()
+        self.publish(model)
+
+
+    def __getstate__(self):
+        return { 'name' : self.shared.name, 'layout' : self.layout }
+
+
+    def __setstate__(self, state):
+        self.layout = state['layout']
+        self.shared = shared_memory.SharedMemory(name=state['name'])
+        self.owner  = False
+
+        self._map_arrays()
+
+
+    def get_version(self):
+        '''
+        Returns the version of the model that the weights in the block belong to.
+        '''
+
+        return int(self.header[1])
+
+
+    def publish(self, model):
+        '''
+        Copies the current weights of the model into the block. There must be a single process
+        publishing to a block.
+        '''
+
+        self.header[0] += 1
+
+        for (name, _, _), array in zip(self.layout, self.arrays):
+            array[...] = getattr(model, name)
+        self.header[1] = model.version
+
+        self.header[0] += 1
+
+
+    def update(self, model):
+        '''
+        Replaces the weights of the model with the ones in the block if these were published
+        after the last time they were read through this object, and returns whether they were.
+        The model gets new arrays, so anything built from its previous ones can tell that they
+        changed.
+        '''
+
+        if int(self.header[0]) == self.read_sequence:
+            return False
+
+        self.read(model)
+
+        return True
+
+
+    def read(self, model):
+        '''
+        Replaces the weights of the model with the ones in the block, whatever their version.
+        While they are being published, the reader sleeps for short intervals instead of
+        spinning, so that it does not keep the publisher from the processor.
+        '''
+
+        while True:
+            sequence = int(self.header[0])
+            if sequence % 2:
+                time.sleep(self.READ_BACKOFF)
+                continue
+
+            version = int(self.header[1])
+            arrays  = [ np.array(array) for array in self.arrays ]
+
+            if int(self.header[0]) == sequence:
+                break
+
+        for (name, _, _), array in zip(self.layout, arrays):
+            setattr(model, name, array)
+        model.version = version
+
+        self.read_sequence = sequence
+
+
+    def close(self):
+        '''
+        Detaches from the block, which is also destroyed if it was created by this object.
+        '''
+
+        self.header = None
+        self.arrays = None
+        self.shared.close()
+
+        if self.owner:
+            self.shared.unlink()
+
+
+    def _map_arrays(self):
+        '''
+        Creates the NumPy views of the header and the weight arrays in the block.
+        '''
+
+        buffer = self.shared.buf
+        offset = self.HEADER_SIZE * 8
+
+        self.header = np.ndarray((self.HEADER_SIZE,), dtype=np.int64, buffer=buffer)
+        self.arrays = []
+
+        # Sequence number of the weights last read through this object.
+        self.read_sequence = None
+
+        for name, shape, dtype in self.layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            self.arrays.append(array)
+            offset += -(-array.nbytes // 8) * 8
+
+
+    @classmethod
+    def _get_size(cls, layout):
+        '''
+        Returns the size of a block for the given weight arrays, each one aligned to 8 bytes.
+        '''
+
+        size = cls.HEADER_SIZE * 8
+        for _, shape, dtype in layout:
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+
+        return max(size, 1)
@@ -0,0 +1,508 @@
+import time
+import zlib
+import queue
+import socket
+import struct
+import threading
+import socketserver
+import numpy as np
+
+from . import board
+from . import player
+from . import selfplay
+
+
+####### PROTOCOL #######
+
+# Every message is a header with its kind and the length of its body, followed by the body.
+HEADER = struct.Struct('!BI')
+
+# Requests of the actors. Weights are pulled with an empty body, and trajectories are pushed as
+# a TRAJECTORY header followed by their scores and features, compressed.
+PULL_WEIGHTS    = 0
+PUSH_TRAJECTORY = 1
+
+# Replies of the learner. Weights are sent as a WEIGHTS header followed by the parameter arrays
+# of the model, and a pushed trajectory is answered with its fate and the current version.
+WEIGHTS = 0
+STATUS  = 1
+
+# Fates of a pushed trajectory. Busy ones should be pushed again later, stale ones were played
+# with weights too old to learn from, rejected ones could not be decoded, and the learner does
+# not take any more once stopped.
+ACCEPTED = 0
+BUSY     = 1
+STALE    = 2
+STOPPED  = 3
+REJECTED = 4
+
+WEIGHTS_HEADER    = struct.Struct('!q')
+TRAJECTORY_HEADER = struct.Struct('!qBIdII')
+STATUS_BODY       = struct.Struct('!Bq')
+
+OUTCOMES = ('Win', 'Loss', 'Tie')
+
+# Largest message body, and largest trajectory once decompressed, in bytes that are accepted.
+MAX_MESSAGE_SIZE    = 1 << 24
+MAX_TRAJECTORY_SIZE = 1 << 26
+
+# Trajectories waiting for the learner before actors are told to hold on to theirs.
+MAX_PENDING = 32
+
+# Number of weight updates a trajectory may fall behind and still be learned from.
+MAX_STALENESS = 16
+
+# Delays in seconds between the attempts of an actor to push a trajectory to a busy learner, or
+# to connect again to a learner it lost its connection to.
+RETRY_DELAY     = 0.05
+MAX_RETRY_DELAY = 2
+
+# Attempts in a row of an actor to connect again before it takes the learner to be gone.
+MAX_RECONNECTS = 5
+
+
+def send_message(sock, kind, body=b''):
+    '''
+    Sends a message of the given kind and body through the socket.
+    '''
+
+    sock.sendall( HEADER.pack(kind, len(body)) + body )
+
+
+def receive_message(sock, max_size=MAX_MESSAGE_SIZE):
+    '''
+    Waits for a message from the socket and returns its kind and body. Raises ConnectionError
+    if the connection is closed or the body is longer than 'max_size' bytes, since the stream
+    cannot be trusted after that.
+    '''
+
+    kind, length = HEADER.unpack( receive_bytes(sock, HEADER.size) )
+
+    if length > max_size:
+        raise ConnectionError('A message of {} bytes is over the limit of {}.'.format(length, max_size))
+
+    return kind, receive_bytes(sock, length)
+
+
+def receive_bytes(sock, count):
+    '''
+    Reads exactly 'count' bytes from the socket.
+    '''
+
+    data = bytearray()
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError('The connection was closed.')
+        data += chunk
+
+    return bytes(data)
+
+
+def pack_weights(agent_model):
+    '''
+    Returns the body of a WEIGHTS message with the version and the parameter arrays of the
+    model.
+    '''
+
+    arrays = [ np.ascontiguousarray(getattr(agent_model, name), dtype='<f8') for name in agent_model.parameters ]
+
+    return WEIGHTS_HEADER.pack(agent_model.version) + b''.join( array.tobytes() for array in arrays )
+
+
+def unpack_weights(agent_model, body):
+    '''
+    Replaces the version and the parameter arrays of the model with the ones in the body of a
+    WEIGHTS message. The arrays are read with the shapes of the ones they replace. Raises
+    ConnectionError if the body is not as long as those arrays, since the peer is then not
+    serving this model, and leaves the model unchanged.
+    '''
+
+    shapes = [ getattr(agent_model, name).shape for name in agent_model.parameters ]
+    size   = WEIGHTS_HEADER.size + 8 * sum( int(np.prod(shape)) for shape in shapes )
+
+    if len(body) != size:
+        raise ConnectionError('The weights take {} bytes instead of {}.'.format(len(body), size))
+
+    offset = WEIGHTS_HEADER.size
+
+    for name, shape in zip(agent_model.parameters, shapes):
+        array = np.frombuffer(body, dtype='<f8', count=int(np.prod(shape)), offset=offset)
+        setattr( agent_model, name, array.reshape(shape).astype(np.float64) )
+        offset += array.nbytes
+
+    agent_model.version = WEIGHTS_HEADER.unpack_from(body)[0]
+
+
+def pack_trajectory(version, outcome, turn_count, elapsed, scores, features):
+    '''
+    Returns the body of a PUSH_TRAJECTORY message with a game played with the weights of the
+    given version.
+    '''
+
+    scores    = np.ascontiguousarray(scores, dtype='<f8')
+    features  = np.ascontiguousarray(features, dtype='<f8')
+    dimension = features.shape[1] if features.ndim == 2 else 0
+
+    header = TRAJECTORY_HEADER.pack( version, OUTCOMES.index(outcome), turn_count, elapsed, len(scores), dimension )
+
+    return header + zlib.compress( scores.tobytes() + features.tobytes() )
+
+
+def unpack_trajectory(body, dimension=None):
+    '''
+    Returns the version, outcome, turn count, elapsed time, scores and features of the game in
+    the body of a PUSH_TRAJECTORY message. Raises ValueError if the body is malformed, if any
+    value is not finite, or if 'dimension' is given and the feature vectors are not that long.
+    '''
+
+    try:
+        version, outcome, turn_count, elapsed, length, width = TRAJECTORY_HEADER.unpack_from(body)
+    except struct.error:
+        raise ValueError('The trajectory header is truncated.')
+
+    if outcome >= len(OUTCOMES):
+        raise ValueError('Unknown outcome {}.'.format(outcome))
+
+    # The learner could not apply features of another length to its weights.
+    if dimension is not None and width != dimension:
+        raise ValueError('The trajectory has {} features per state instead of {}.'.format(width, dimension))
+
+    size = 8 * length * (1 + width)
+    if size > MAX_TRAJECTORY_SIZE:
+        raise ValueError('A trajectory of {} bytes is over the limit of {}.'.format(size, MAX_TRAJECTORY_SIZE))
+
+    # Decompressing at most one byte more than expected keeps a small body from inflating
+    # into a huge one.
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(body[TRAJECTORY_HEADER.size:], size + 1)
+    except zlib.error as error:
+        raise ValueError('The trajectory cannot be decompressed: {}'.format(error))
+
+    if len(data) != size or not decompressor.eof:
+        raise ValueError('The trajectory does not hold {} scores of {} features.'.format(length, width))
+    if decompressor.unused_data:
+        raise ValueError('The trajectory is followed by {} bytes of other data.'.format(len(decompressor.unused_data)))
+
+    values = np.frombuffer(data, dtype='<f8')
+
+    # A single NaN or infinity would spread to every weight of the model.
+    if not np.isfinite(values).all():
+        raise ValueError('The trajectory holds values that are not finite.')
+
+    scores   = values[:length].astype(np.float64)
+    features = values[length:].reshape(length, width).astype(np.float64)
+
+    return version, OUTCOMES[outcome], turn_count, elapsed, scores, features
+
+
+
+####### PARAMETER SERVER #######
+
+class ParameterServer(socketserver.ThreadingTCPServer):
+    '''
+    Parameter server class
+
+    Serves the weights of the learner's model to actors anywhere on the network and takes the
+    trajectories of the games they play, over TCP. Every connection is handled by a thread of
+    its own, which puts the trajectories it receives in the 'trajectories' queue as
+    selfplay.GAME_PLAYED messages, so the learner takes them just like the ones of local
+    actors.
+
+    The queue is bounded, and while it is full the actors are told that the learner is busy and
+    keep their trajectories until they can push them. Trajectories played with weights more
+    than 'max_staleness' updates older than the current ones are dropped, and the actor pulls
+    the current weights.
+    '''
+
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(self, address, agent_model, max_pending=MAX_PENDING, max_staleness=MAX_STALENESS):
+
+        super().__init__(address, ActorHandler)
+
+        self.trajectories  = queue.Queue(max_pending)
+        self.max_staleness = max_staleness
+        self.dimension     = len(agent_model.coefs_)
+        self.stopped       = False
+
+        # Versions of the latest weights published, from oldest to newest, and the set of the
+        # ones that are recent enough to learn from. Both are replaced as a whole, so that the
+        # connection threads never see them half updated.
+        self.published_versions = ()
+        self.fresh_versions     = frozenset()
+        self.weights            = None
+
+        self.actor_count    = 0
+        self.stale_games    = 0
+        self.rejected_games = 0
+        self.busy_replies   = 0
+        self.lock           = threading.Lock()
+
+        self.publish(agent_model)
+
+
+    def start(self):
+        '''
+        Starts serving the actors in a background thread.
+        '''
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+    def publish(self, agent_model):
+        '''
+        Makes the current weights of the model the ones served to the actors.
+        '''
+
+        versions = self.published_versions + (agent_model.version,)
+        versions = versions[-(self.max_staleness + 1):]
+
+        self.weights            = pack_weights(agent_model)
+        self.published_versions = versions
+        self.fresh_versions     = frozenset(versions)
+
+
+    def get_version(self):
+        '''
+        Returns the version of the weights currently served.
+        '''
+
+        return self.published_versions[-1]
+
+
+    def register_actor(self):
+        '''
+        Returns the id of a newly connected actor.
+        '''
+
+        with self.lock:
+            worker_id = self.actor_count
+            self.actor_count += 1
+
+        return worker_id
+
+
+    def receive_trajectory(self, worker_id, body):
+        '''
+        Queues the trajectory pushed by an actor for the learner if it is fresh enough and there
+        is room for it, and returns its fate. Trajectories with features that do not fit the
+        weights of the model are rejected like malformed ones.
+        '''
+
+        if self.stopped:
+            return STOPPED
+
+        try:
+            version, outcome, turn_count, elapsed, scores, features = unpack_trajectory(body, self.dimension)
+        except ValueError:
+            with self.lock:
+                self.rejected_games += 1
+            return REJECTED
+
+        if version not in self.fresh_versions:
+            with self.lock:
+                self.stale_games += 1
+            return STALE
+
+        try:
+            self.trajectories.put_nowait( (selfplay.GAME_PLAYED, worker_id, version, outcome, turn_count, elapsed,
+                                           scores, features) )
+        except queue.Full:
+            with self.lock:
+                self.busy_replies += 1
+            return BUSY
+
+        return ACCEPTED
+
+
+    def stop(self):
+        '''
+        Stops taking trajectories and tells the actors to stop the next time they get in touch.
+        '''
+
+        self.stopped = True
+
+
+    def close(self):
+        '''
+        Stops serving and closes the listening socket.
+        '''
+
+        self.shutdown()
+        self.server_close()
+
+
+
+class ActorHandler(socketserver.BaseRequestHandler):
+    '''
+    Actor handler class
+
+    Answers the requests of an actor until it disconnects or breaks the protocol, which only
+    closes its own connection.
+    '''
+
+    def handle(self):
+
+        server    = self.server
+        worker_id = server.register_actor()
+
+        while True:
+            try:
+                kind, body = receive_message(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            if kind == PULL_WEIGHTS:
+                if server.stopped:
+                    send_message( self.request, STATUS, STATUS_BODY.pack(STOPPED, server.get_version()) )
+                else:
+                    send_message( self.request, WEIGHTS, server.weights )
+
+            elif kind == PUSH_TRAJECTORY:
+                fate = server.receive_trajectory(worker_id, body)
+                send_message( self.request, STATUS, STATUS_BODY.pack(fate, server.get_version()) )
+
+            else:
+                return
+
+
+
+####### REMOTE ACTOR #######
+
+class RemoteActor:
+    '''
+    Remote actor class
+
+    Plays training games like selfplay.SelfPlayActor, but gets the weights from a parameter
+    server and pushes the trajectories of its games to it, so it can run on any machine that
+    reaches the server. The weights are pulled whenever the server has new ones, which is after
+    almost every game.
+
+    A connection that is lost or breaks the protocol is dropped, along with the game being
+    pushed, and the actor connects again. It gives up after MAX_RECONNECTS failed attempts in
+    a row.
+    '''
+
+    def __init__(self, address, trainee_config, opponent_config):
+        '''
+        'address' is the (host, port) pair of the parameter server, and the configs are the same
+        as those of a SelfPlayActor.
+        '''
+
+        self.address         = address
+        self.trainee_config  = trainee_config
+        self.opponent_config = opponent_config
+
+        self.games_played   = 0
+        self.stale_games    = 0
+        self.rejected_games = 0
+        self.busy_replies   = 0
+        self.reconnects     = 0
+
+
+    def run(self):
+        '''
+        Plays games until the server stops or goes away. This is the entry point of the actor
+        process.
+        '''
+
+        selfplay.seed_process()
+
+        b = board.Board()
+        trainee  = player.LinearModelPlayer('black', b, **self.trainee_config)
+        opponent = player.LinearModelPlayer('white', b, **self.opponent_config)
+
+        failures = 0
+
+        try:
+            while True:
+                try:
+                    with socket.create_connection(self.address) as sock:
+                        if not self.pull_weights(sock, trainee):
+                            return
+
+                        failures = 0
+                        self.play_games(sock, b, trainee, opponent)
+                        return
+
+                except ConnectionError:
+                    failures += 1
+                    if failures > MAX_RECONNECTS:
+                        return
+
+                    self.reconnects += 1
+                    time.sleep( min(RETRY_DELAY * 2 ** failures, MAX_RETRY_DELAY) )
+
+        except KeyboardInterrupt:
+            return
+
+
+    def play_games(self, sock, b, trainee, opponent):
+        '''
+        Plays games and pushes them through the socket until the server stops.
+        '''
+
+        while True:
+            version = trainee.model.version
+            game    = selfplay.play_trajectory(b, trainee, opponent)
+
+            fate, server_version = self.push_trajectory( sock, pack_trajectory(version, *game) )
+            if fate == STOPPED:
+                return
+
+            self.games_played += 1
+
+            if server_version != trainee.model.version and not self.pull_weights(sock, trainee):
+                return
+
+
+    def pull_weights(self, sock, trainee):
+        '''
+        Replaces the weights of the trainee model with the ones served, and returns False if the
+        server stopped instead.
+        '''
+
+        send_message(sock, PULL_WEIGHTS)
+        kind, body = receive_message(sock)
+
+        if kind != WEIGHTS:
+            return False
+
+        unpack_weights(trainee.model, body)
+
+        return True
+
+
+    def push_trajectory(self, sock, body):
+        '''
+        Pushes a trajectory to the server, waiting while the learner is busy, and returns its
+        fate along with the version of the weights the server has.
+        '''
+
+        delay = RETRY_DELAY
+
+        while True:
+            send_message(sock, PUSH_TRAJECTORY, body)
+            kind, reply = receive_message(sock)
+
+            if kind != STATUS or len(reply) != STATUS_BODY.size:
+                raise ConnectionError('The trajectory was not answered with a status.')
+
+            fate, server_version = STATUS_BODY.unpack(reply)
+
+            if fate != BUSY:
+                break
+
+            self.busy_replies += 1
+            time.sleep(delay)
+            delay = min(2 * delay, MAX_RETRY_DELAY)
+
+        if fate == STALE:
+            self.stale_games += 1
+        elif fate == REJECTED:
+            self.rejected_games += 1
+
+        return fate, server_version
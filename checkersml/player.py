@@ -1,13 +1,16 @@
 import os
 import pickle
+import time
 import random
 import datetime
 import collections
 import numpy as np
 from abc import ABC, abstractmethod
 
+from . import board
 from . import features
 from . import model
+from . import searchpool
 
 import pdb
 from pprint import pprint
@@ -15,6 +18,312 @@ from pprint import pprint
 
 State = collections.namedtuple('State', ['score', 'features'])
 
+# Deepest iteration of a time limited search.
+MAX_SEARCH_DEPTH = 64
+
+# Longest line the search can follow: the root move, one move per depth and the captures of the
+# quiescence search past the horizon, of which there can be at most 24.
+MAX_SEARCH_PLY = MAX_SEARCH_DEPTH + 1 + 24
+
+# Default number of nodes every search may spend in the quiescence search.
+QUIESCENCE_BUDGET = 5000
+
+# Width of the null windows of the principal variation search. Scores are real numbers, so a null
+# window is a window too narrow for any score but the exact ones to fall inside it.
+NULL_WINDOW = 1e-9
+
+# Default width of the aspiration windows on each side of the guessed score, on the scale of the
+# model scores, which are between -1 and 1 for lost and won games.
+ASPIRATION_WINDOW = 0.1
+
+
+####### TRANSPOSITION TABLE #######
+
+# Bound types of the scores stored in the transposition table.
+TT_EMPTY = 0
+TT_EXACT = 1
+TT_LOWER = 2
+TT_UPPER = 3
+
+
+class TranspositionTable:
+    '''
+    Transposition table class
+
+    Fixed size hash table that stores the results of previous searches indexed by the Zobrist
+    key of the position. Entries live in preallocated NumPy arrays and are grouped in buckets of
+    two slots: the first one keeps the deepest search seen for the bucket and the second one is
+    always replaced. Every entry is stamped with the version of the model weights that produced
+    its score, and scores from other versions are ignored.
+    '''
+
+    ENTRY_SIZE = 8 + 1 + 8 + 1 + 2 + 4 # Key, depth, score, bound, move and version bytes.
+
+    def __init__(self, size_mb=16):
+
+        # Use a power of two number of buckets so that the index is just a mask of the key.
+        buckets = max(1, int(size_mb * 2**20) // (2 * self.ENTRY_SIZE))
+        buckets = 2 ** (buckets.bit_length() - 1)
+
+        self.mask     = buckets - 1
+        self.keys     = np.zeros((buckets, 2), dtype=np.uint64)
+        self.depths   = np.zeros((buckets, 2), dtype=np.int8)
+        self.scores   = np.zeros((buckets, 2), dtype=np.float64)
+        self.bounds   = np.zeros((buckets, 2), dtype=np.int8)
+        self.moves    = np.zeros((buckets, 2), dtype=np.int16)
+        self.versions = np.zeros((buckets, 2), dtype=np.uint32)
+
+
+    def clear(self):
+        '''
+        Removes all the entries of the table.
+        '''
+
+        self.bounds.fill(TT_EMPTY)
+
+
+    def probe(self, key, version):
+        '''
+        Looks up a position by its key and returns a (depth, score, bound, move) tuple, or None
+        if it is not in the table. The move code is kept for entries of an older model version,
+        but their bound is reported as TT_EMPTY since the score is no longer valid.
+        '''
+
+        bucket = key & self.mask
+        for slot in (0, 1):
+            if self.bounds[bucket, slot] != TT_EMPTY and self.keys[bucket, slot] == key:
+                if self.versions[bucket, slot] != version:
+                    return -1, 0.0, TT_EMPTY, int(self.moves[bucket, slot])
+
+                return ( int(self.depths[bucket, slot]), float(self.scores[bucket, slot]),
+                         int(self.bounds[bucket, slot]), int(self.moves[bucket, slot]) )
+
+        return None
+
+
+    def store(self, key, depth, score, bound, move, version):
+        '''
+        Saves the result of a search. The depth-preferred slot is only replaced by searches that
+        are at least as deep or when its entry is stale, otherwise the entry goes to the
+        always-replace slot.
+        '''
+
+        bucket = key & self.mask
+
+        if ( self.bounds[bucket, 0] == TT_EMPTY or self.keys[bucket, 0] == key
+             or self.versions[bucket, 0] != version or depth >= self.depths[bucket, 0] ):
+            slot = 0
+        else:
+            slot = 1
+
+        self.keys[bucket, slot]     = key
+        self.depths[bucket, slot]   = depth
+        self.scores[bucket, slot]   = score
+        self.bounds[bucket, slot]   = bound
+        self.moves[bucket, slot]    = move
+        self.versions[bucket, slot] = version
+
+
+####### EVALUATION #######
+
+class PieceSquareEvaluator:
+    '''
+    Piece-square evaluator class
+
+    Scores positions with a linear model without building their feature vectors. Position value
+    features only depend on the piece on their square and the piece count features on the
+    board counters, so their weighted sum folds into the score of every kind of piece on every
+    square. These are tabulated for each byte of the bitboards, so that the pieces of a kind
+    are scored with four lookups. Any other feature is computed and weighted as usual.
+
+    The tables are compiled from the model coefficients and have to be compiled again whenever
+    these change.
+    '''
+
+    # Kinds of pieces counted by each of the piece count features.
+    COUNTED_TILES = { features.BlackPiecesFeature : (board.BLACK_PAWN, board.BLACK_KING),
+                      features.WhitePiecesFeature : (board.WHITE_PAWN, board.WHITE_KING),
+                      features.BlackKingsFeature  : (board.BLACK_KING,),
+                      features.WhiteKingsFeature  : (board.WHITE_KING,) }
+
+    # Kinds of pieces in the order their masks are scored by evaluate().
+    PIECE_TILES = (board.BLACK_PAWN, board.BLACK_KING, board.WHITE_PAWN, board.WHITE_KING)
+
+    def __init__(self, features):
+
+        self.features = features
+        self.coefs    = None
+
+        self.empty_score   = 0
+        self.byte_scores   = None
+        self.other_weights = None
+
+
+    def compile(self, coefs):
+        '''
+        Builds the evaluation tables for the given model coefficients.
+        '''
+
+        # The score of a board with every square empty, and for every kind of piece and square
+        # the score change of placing the piece there.
+        empty_score   = 0
+        piece_scores  = { tile: [0] * 32 for tile in self.PIECE_TILES }
+        other_weights = []
+
+        for f, coef in zip(self.features, coefs):
+            coef = float(coef)
+
+            if isinstance(f, features.PositionValueFeature):
+                s = board.coords_to_square(f.col, f.row)
+                empty_score += coef * f.value_map[board.EMPTY]
+                for tile in self.PIECE_TILES:
+                    piece_scores[tile][s] += coef * (f.value_map[tile] - f.value_map[board.EMPTY])
+
+            elif type(f) in self.COUNTED_TILES:
+                for tile in self.COUNTED_TILES[type(f)]:
+                    for s in range(32):
+                        piece_scores[tile][s] += coef / 12
+
+            else:
+                other_weights.append( (coef, f) )
+
+        # byte_scores[tile][i][byte] is the score of the pieces of kind 'tile' placed as given by
+        # 'byte' on the squares 8*i to 8*i+7. Every entry extends the one without its highest bit.
+        byte_scores = {}
+        for tile in self.PIECE_TILES:
+            byte_scores[tile] = []
+            for i in range(4):
+                table = [0] * 256
+                for byte in range(1, 256):
+                    high = byte.bit_length() - 1
+                    table[byte] = table[byte ^ (1 << high)] + piece_scores[tile][8*i + high]
+                byte_scores[tile].append(table)
+
+        self.empty_score   = empty_score
+        self.byte_scores   = [ byte_scores[tile] for tile in self.PIECE_TILES ]
+        self.other_weights = other_weights
+        self.coefs         = coefs
+
+
+    def evaluate(self, b):
+        '''
+        Returns the linear model score of the current board.
+        '''
+
+        score = self.empty_score
+        masks = ( b.black & ~b.kings, b.black & b.kings, b.white & ~b.kings, b.white & b.kings )
+
+        for mask, tables in zip(masks, self.byte_scores):
+            if mask:
+                score += ( tables[0][mask & 0xFF]         + tables[1][(mask >> 8) & 0xFF] +
+                           tables[2][(mask >> 16) & 0xFF] + tables[3][mask >> 24] )
+
+        for coef, f in self.other_weights:
+            score += coef * f.compute_value(b)
+
+        return score
+
+
+####### MOVE ORDERING #######
+
+class MoveOrderer:
+    '''
+    Move orderer class
+
+    Sorts the moves of a search node so that the ones most likely to cause a cutoff are
+    searched first: the hash move from the transposition table, then promotions and then the
+    quiet moves ranked by the killer moves of the node's depth and by the history table, which
+    scores every (source, destination) pair by the cutoffs it caused. Captures are mandatory,
+    so they are never mixed with quiet moves. It also keeps track of how often the first move
+    searched was the one to cause the cutoff.
+    '''
+
+    def __init__(self, max_depth=MAX_SEARCH_DEPTH):
+
+        self.killers = [ [-1, -1] for _ in range(max_depth + 1) ]
+        self.history = [0] * 1024
+
+        self.cutoffs            = 0
+        self.first_move_cutoffs = 0
+
+
+    def new_search(self):
+        '''
+        Prepares the tables for a new root search. Killer moves are forgotten and the history
+        scores are halved so that recent cutoffs weigh more.
+        '''
+
+        for killers in self.killers:
+            killers[0] = killers[1] = -1
+
+        self.history = [ score // 2 for score in self.history ]
+
+
+    def reset_stats(self):
+        '''
+        Resets the cutoff counters.
+        '''
+
+        self.cutoffs            = 0
+        self.first_move_cutoffs = 0
+
+
+    def order(self, moves, depth, hash_move=-1):
+        '''
+        Sorts the list of moves in place, keeping generation order among equally ranked moves.
+        '''
+
+        killers = self.killers[depth]
+        history = self.history
+
+        def rank(move):
+            code = move.code
+            if code == hash_move:
+                return 1 << 33
+            if move.promote:
+                return 1 << 32
+            if move.capture:
+                return 0
+            if code == killers[0]:
+                return (1 << 31) + 1
+            if code == killers[1]:
+                return 1 << 31
+            return history[code]
+
+        moves.sort(key=rank, reverse=True)
+
+
+    def record_cutoff(self, move, depth, draft, index):
+        '''
+        Registers the move that caused a cutoff at a node, where 'index' is its position in the
+        ordered list of moves.
+        '''
+
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+        if not move.capture:
+            code    = move.code
+            killers = self.killers[depth]
+            if killers[0] != code:
+                killers[1] = killers[0]
+                killers[0] = code
+
+            self.history[code] += draft * draft
+
+
+    def get_first_move_cutoff_rate(self):
+        '''
+        Returns the fraction of cutoffs that were caused by the first move searched.
+        '''
+
+        if not self.cutoffs:
+            return 0
+
+        return self.first_move_cutoffs / self.cutoffs
+
+
 
 class Player(ABC):
     '''
@@ -60,17 +369,46 @@ class MLPlayer(Player):
     and use an arbitrary machine learning model to play and train.
     '''
 
-    def __init__(self, color, board, train         = False, 
-                                     learning_rate = 0,
-                                     reg_const     = 0,
-                                     lambda_const  = 0,
-                                     search_depth  = 0,
-                                     epsilon       = 0,
-                                     save_file     = 'parameters.pickle', 
-                                     no_records    = False):
+    def __init__(self, color, board, train             = False, 
+                                     learning_rate     = 0,
+                                     reg_const         = 0,
+                                     lambda_const      = 0,
+                                     search_depth      = 0,
+                                     epsilon           = 0,
+                                     save_file         = 'parameters.pickle', 
+                                     no_records        = False,
+                                     tt_size           = 16,
+                                     time_budget       = None,
+                                     quiescence_budget = QUIESCENCE_BUDGET,
+                                     aspiration_window = ASPIRATION_WINDOW,
+                                     search_processes  = 0):
+        '''
+        If 'time_budget' is given, moves are searched with iterative deepening until the budget,
+        in milliseconds, runs out and 'search_depth' is only used as the maximum depth when it is
+        greater than zero. Otherwise every move is searched to exactly 'search_depth'. Depths
+        above MAX_SEARCH_DEPTH are not supported.
+
+        'quiescence_budget' is the number of nodes that the search of every root move may spend
+        resolving the captures pending at its leaves. Zero disables the quiescence search.
+
+        'aspiration_window' is the distance from the score of the previous iteration to each
+        bound of the window that iterative deepening searches the next one with. Zero makes
+        every iteration use the whole window.
+
+        If 'search_processes' is greater than one, the root moves of fixed depth searches are
+        split among that many processes. These find the same move and score as searching them
+        here as long as the quiescence search of no root move runs out of budget, since the
+        positions where it stops depend on the windows and the move ordering of each search. The
+        principal variation may be another line with the same score for the same reason.
+        Searches with a time budget are always made here.
+        '''
         
         super().__init__(color, board)
 
+        # The killer moves and the principal variation table are sized for the deepest search.
+        if not 0 <= search_depth <= MAX_SEARCH_DEPTH:
+            raise ValueError('The search depth must be between 0 and {}.'.format(MAX_SEARCH_DEPTH))
+
         self.train = train
 
         self.curr_cycle = 1
@@ -81,6 +419,39 @@ class MLPlayer(Player):
         self.lambda_const  = lambda_const
         self.search_depth  = search_depth
         self.epsilon       = epsilon
+        self.time_budget   = time_budget
+
+        self.nodes_searched  = 0
+        self.depth_limit     = search_depth
+        self.completed_depth = None
+        self.deadline        = None
+        self.search_aborted  = False
+        self.ply             = 0
+
+        self.quiescence_budget = quiescence_budget
+        self.quiescence_nodes  = 0
+        self.aspiration_window = aspiration_window
+
+        # Null window and aspiration searches, and how many of them had to be searched again.
+        self.null_window_searches  = 0
+        self.null_window_failures  = 0
+        self.aspiration_searches   = 0
+        self.aspiration_failures   = 0
+
+        # When the board traces allocations, every search node adds the memory it allocates
+        # itself, leaving out that of its children, to 'allocated_bytes', and is counted in
+        # 'allocating_nodes' if it allocates anything and in 'traced_nodes' in any case. The
+        # memory of a node is measured from the moment it is reached until it is left, one
+        # stretch between two of its children at a time.
+        self.allocated_bytes   = 0
+        self.allocating_nodes  = 0
+        self.traced_nodes      = 0
+        self.node_allocations  = [0] * (MAX_SEARCH_PLY + 2)
+        self.traced_memory     = None
+
+        self.pv_table        = [()] * (MAX_SEARCH_PLY + 2)
+        self.tt = TranspositionTable(tt_size)
+        self.move_orderer = MoveOrderer()
 
         self.save_file  = save_file
         self.records_X  = None
@@ -91,9 +462,27 @@ class MLPlayer(Player):
         if save_file_dir and not os.path.exists(save_file_dir):
             os.makedirs(save_file_dir)
 
+        # When set to a list, the states a training player goes through are appended to it
+        # instead of updating the model, so that a learner elsewhere can learn from them with
+        # learn_trajectory().
+        self.trajectory = None
+
+        # When set to a SharedParameters block, the model picks the latest weights published
+        # to it before every move.
+        self.shared_parameters = None
+
         self.set_features()
         self.set_model()
 
+        self.search_pool = None
+        if search_processes > 1:
+            config = dict( search_depth      = search_depth,
+                           save_file         = save_file,
+                           tt_size           = tt_size,
+                           quiescence_budget = quiescence_budget,
+                           aspiration_window = aspiration_window )
+            self.search_pool = searchpool.RootSearchPool(self, search_processes, config)
+
         dt = datetime.datetime.today().strftime('%Y-%m-%d_%H:%M:%S')
         self.logdir = os.path.join('training_data', color + '_player', dt)
 
@@ -140,6 +529,31 @@ class MLPlayer(Player):
         return self.model.predict(x)
 
 
+    def evaluate_board(self):
+        '''
+        Evaluates the current board state during the search.
+        '''
+
+        return self.evaluate(self.compute_features())
+
+
+    def compute_line_features(self, moves):
+        '''
+        Computes the features of the position reached by playing the given sequence of moves
+        from the current board.
+        '''
+
+        for move in moves:
+            self.make_temporary_move(move)
+
+        line_features = self.compute_features()
+
+        for move in moves:
+            self.undo_temporary_move()
+
+        return line_features
+
+
     def fit_data(self):
         '''
         Adjust the model using the latest gathered data.
@@ -157,7 +571,11 @@ class MLPlayer(Player):
         the optimal one.
         '''
 
-        legal_moves = self.board.get_all_legal_moves(self.color)
+        if self.shared_parameters is not None:
+            self.shared_parameters.update(self.model)
+
+        # Multi-jumps are picked as a whole, so the turn is over once the move is made.
+        legal_moves = self.board.get_all_compound_moves(self.color)
 
         if not legal_moves:
             raise ValueError('There are no available moves for the {} player.'.format(self.color))
@@ -167,21 +585,26 @@ class MLPlayer(Player):
             return random.choice(legal_moves)
 
         else:
-            best_score = float('-inf')
-            best_move  = None
-            next_color = 'white' if self.color == 'black' else 'black'
-
-            for move in legal_moves:
-                score, leaf_features = self.minimax_search(move, 'min', next_color, 0)
-                if score > best_score:
-                    best_score  = score
-                    best_move   = move
-                    pv_features = leaf_features
+            self.nodes_searched = 0
+            self.move_orderer.new_search()
+
+            if self.time_budget:
+                best_score, best_move, pv = self.iterative_deepening(legal_moves)
+            elif self.search_pool is not None:
+                self.depth_limit = self.search_depth
+                best_score, best_move, pv = self.search_pool.search_root(self, legal_moves)
+            else:
+                self.depth_limit = self.search_depth
+                best_score, best_move, pv = self.search_root(legal_moves)
 
             # Call the TD(lambda) function to update the model based on the next state.
             if self.train:
+                pv_features = self.compute_line_features(pv)
                 next_state = State(best_score, np.array(pv_features))
-                self.model.td_lambda(self.prev_state, next_state)
+                if self.trajectory is not None:
+                    self.trajectory.append(next_state)
+                else:
+                    self.model.td_lambda(self.prev_state, next_state)
                 self.prev_state = next_state
 
                 if not self.no_records:
@@ -190,71 +613,463 @@ class MLPlayer(Player):
             return best_move
 
 
-    def minimax_search(self, move, agent, color, depth):
+    def make_temporary_move(self, move):
+        '''
+        Makes a temporary update of the board, keeping track of the ply of the search.
+        '''
+
+        if self.board.trace_allocations:
+            self._add_node_allocations()
+
+        self.ply += 1
+        self.board.temporary_update(move)
+
+        if self.board.trace_allocations:
+            self.node_allocations[self.ply] = 0
+            self.traced_memory = board.traced_memory_mark()
+
+
+    def undo_temporary_move(self):
+        '''
+        Reverts the last temporary update made with make_temporary_move.
+        '''
+
+        if self.board.trace_allocations:
+            self._add_node_allocations()
+
+            allocated = self.node_allocations[self.ply]
+            if allocated > 0:
+                self.allocated_bytes  += allocated
+                self.allocating_nodes += 1
+            self.traced_nodes += 1
+
+        self.ply -= 1
+        self.board.undo_temporary_update()
+
+        if self.board.trace_allocations:
+            self.traced_memory = board.traced_memory_mark()
+
+
+    def _add_node_allocations(self):
+        '''
+        Adds the memory allocated since the last temporary update or undo to the node of the
+        current ply. The root of the search is not a node.
+        '''
+
+        if self.ply and self.traced_memory is not None:
+            allocated = board.traced_memory_since(self.traced_memory) - board.Board.trace_overhead
+            if allocated > 0:
+                self.node_allocations[self.ply] += allocated
+
+
+    def get_allocations_per_node(self):
+        '''
+        Returns the average number of bytes allocated by every search node traced so far, and
+        the fraction of them that allocated anything.
+        '''
+
+        if not self.traced_nodes:
+            return 0, 0
+
+        return self.allocated_bytes / self.traced_nodes, self.allocating_nodes / self.traced_nodes
+
+
+    def iterative_deepening(self, legal_moves):
+        '''
+        Searches the root moves one depth at a time until the time budget runs out, and returns
+        the result of the deepest iteration that was completed. The first iteration always runs
+        to completion so that there is a move to return.
+        '''
+
+        start     = time.perf_counter()
+        max_depth = self.search_depth if self.search_depth > 0 else MAX_SEARCH_DEPTH
+
+        legal_moves = list(legal_moves)
+        result      = None
+
+        for depth in range(max_depth + 1):
+            self.depth_limit = depth
+
+            iteration = self.aspiration_search(legal_moves, result[0] if result else None)
+            if not iteration:
+                break
+
+            result = iteration
+            self.completed_depth = depth
+
+            # Later iterations start with the best move found so far. Deeper positions are
+            # ordered by the best moves stored in the transposition table.
+            legal_moves.remove(result[1])
+            legal_moves.insert(0, result[1])
+
+            self.deadline = start + self.time_budget / 1000
+            if time.perf_counter() >= self.deadline:
+                break
+
+        self.deadline = None
+
+        return result
+
+
+    def aspiration_search(self, legal_moves, guess):
+        '''
+        Searches the root moves with a window centred on the score guessed for them, and searches
+        them again with the whole window if the score falls outside of it. Returns the same as
+        search_root(). Without a guess the whole window is used from the start.
+        '''
+
+        if guess is None or not self.aspiration_window:
+            return self.search_root(legal_moves)
+
+        alpha = guess - self.aspiration_window
+        beta  = guess + self.aspiration_window
+
+        self.aspiration_searches += 1
+        result = self.search_root(legal_moves, alpha, beta)
+
+        if result and not alpha < result[0] < beta:
+            self.aspiration_failures += 1
+            result = self.search_root(legal_moves)
+
+        return result
+
+
+    def search_root(self, legal_moves, alpha=float('-inf'), beta=float('inf')):
+        '''
+        Searches every root move up to the current depth limit and returns a tuple with the best
+        score, the best move and the principal variation, as the sequence of moves leading to the
+        leaf the score comes from, or None if the search ran out of time. The score is only exact
+        if it falls inside the (alpha, beta) window.
+        '''
+
+        best_score = float('-inf')
+        best_move  = None
+        pv         = None
+        next_color = 'white' if self.color == 'black' else 'black'
+
+        self.search_aborted = False
+
+        # The best score found so far is the lower bound for the rest of the root moves. Every
+        # root move has a quiescence budget of its own, as when the moves are searched apart by
+        # a root search pool.
+        for i, move in enumerate(legal_moves):
+            self.quiescence_nodes = 0
+
+            if i == 0:
+                score = self.minimax_search(move, 'min', next_color, 0, alpha, beta)
+            else:
+                score = self.principal_variation_search(move, 'min', next_color, 0, max(alpha, best_score), beta)
+
+            if self.search_aborted:
+                return None
+
+            if score > best_score:
+                best_score = score
+                best_move  = move
+                pv         = (move,) + self.pv_table[1]
+
+            if best_score >= beta:
+                break
+
+        return best_score, best_move, pv
+
+
+    def search_move(self, move, alpha=float('-inf')):
+        '''
+        Searches a single root move up to the current depth limit, and returns its score along
+        with the principal variation starting with it. The score is exact if it is greater than
+        'alpha', and an upper bound otherwise. This is how the processes of a root search pool
+        search the moves they are sent.
+        '''
+
+        next_color = 'white' if self.color == 'black' else 'black'
+
+        self.search_aborted   = False
+        self.quiescence_nodes = 0
+
+        score = self.minimax_search(move, 'min', next_color, 0, alpha, float('inf'))
+
+        return score, (move,) + self.pv_table[1]
+
+
+    def principal_variation_search(self, move, agent, color, depth, alpha, beta):
+        '''
+        Searches a move that is not the first one of its node, which is expected not to improve
+        on the best move found so far. The move is first searched with a null window at the bound
+        of the agent choosing it, which only tells whether it is better, and it is only searched
+        with the whole (alpha, beta) window if it is. The arguments are those of minimax_search().
+        '''
+
+        # The agent choosing the move is the opposite of the one in turn after it.
+        if agent == 'min':
+            null_alpha, null_beta = alpha, alpha + NULL_WINDOW
+        else:
+            null_alpha, null_beta = beta - NULL_WINDOW, beta
+
+        self.null_window_searches += 1
+        score = self.minimax_search(move, agent, color, depth, null_alpha, null_beta)
+
+        # Scores inside the null window are exact, the rest are bounds.
+        if alpha < score < beta and not null_alpha < score < null_beta and not self.search_aborted:
+            self.null_window_failures += 1
+            score = self.minimax_search(move, agent, color, depth, alpha, beta)
+
+        return score
+
+
+    def get_null_window_failure_rate(self):
+        '''
+        Returns the fraction of null window searches that had to be searched again.
+        '''
+
+        if not self.null_window_searches:
+            return 0
+
+        return self.null_window_failures / self.null_window_searches
+
+
+    def get_aspiration_failure_rate(self):
+        '''
+        Returns the fraction of aspiration window searches that had to be searched again.
+        '''
+
+        if not self.aspiration_searches:
+            return 0
+
+        return self.aspiration_failures / self.aspiration_searches
+
+
+    def reset_search_stats(self):
+        '''
+        Resets the null window and aspiration search counters.
+        '''
+
+        self.null_window_searches = 0
+        self.null_window_failures = 0
+        self.aspiration_searches  = 0
+        self.aspiration_failures  = 0
+
+
+    def minimax_search(self, move, agent, color, depth, alpha=float('-inf'), beta=float('inf')):
         '''
         Does a minimax look ahead search from the position resulting after picking the given move.
+        Branches that cannot change the result are pruned using the alpha and beta bounds, where
+        alpha is the score already guaranteed to the max agent and beta the one guaranteed to the
+        min agent. Scores outside of the (alpha, beta) window are only bounds of the real value.
+
+        The moves that lead from the position after 'move' to the leaf the score comes from are
+        left in the principal variation table, at the entry of the ply of that position, so that
+        only the features of the principal variation leaf have to be computed.
         '''
 
+        self.nodes_searched += 1
+
+        ply = self.ply + 1
+        self.pv_table[ply] = ()
+
+        # Check the clock every few nodes and unwind the whole search once the time is up.
+        if self.deadline and not self.nodes_searched % 64 and time.perf_counter() >= self.deadline:
+            self.search_aborted = True
+        if self.search_aborted:
+            return 0
+
         next_agent = 'min' if agent == 'max' else 'max'
         next_color = 'white' if color == 'black' else 'black'
 
-        undo_key = self.board.temporary_update(move)
+        self.make_temporary_move(move)
 
         # Check if game is over.
         if self.board.game_over:
-            leaf_features = self.compute_features()
-            self.board.undo_temporary_update(undo_key)
-            return self.evaluate(leaf_features), leaf_features
-
-        # Check if a second jump is available.
-        if move.capture:
-            sequential_jumps = [ m for m in self.board.get_legal_moves(move.dst[0], move.dst[1], cache=False) if m.capture ]
-        else:
-            sequential_jumps = None
-
-        # A second available jump means the same player gets to move again, but has to pick one of those jumps.
-        if sequential_jumps:
-            legal_moves = sequential_jumps
-            agent, next_agent = next_agent, agent
-        else:
-            legal_moves = self.board.get_all_legal_moves(color, cache=False)
+            score = self.evaluate_board()
+            self.undo_temporary_move()
+            return score
+
+        # Check if this position was already searched to the same depth and that settles it. Only
+        # scores outside of the window are used, since those are never part of the principal
+        # variation and do not need one. Scores of deeper searches, which kings can run into by
+        # going back and forth, are not used either, so that the score of a search only depends
+        # on the position, the depth and the weights, and not on the searches made before it.
+        key       = self.board.zobrist_key
+        draft     = self.depth_limit - depth
+        hash_move = -1
+
+        if draft > 0:
+            entry = self.tt.probe(key, self.model.version)
+            if entry:
+                tt_depth, tt_score, tt_bound, hash_move = entry
+                if tt_depth == draft and ( (tt_bound != TT_UPPER and tt_score >= beta) or
+                                           (tt_bound != TT_LOWER and tt_score <= alpha) ):
+                    self.undo_temporary_move()
+                    return tt_score
 
         # A player with no possible moves loses the game.
-        if not legal_moves:
-            leaf_features = self.compute_features()
-            self.board.undo_temporary_update(undo_key)
+        if not self.board.has_legal_moves(color):
+            self.undo_temporary_move()
             if self.color == color:
-                return -1, leaf_features
+                return -1
             else:
-                return  1, leaf_features
+                return  1
+
+        # If the max depth is reached, bootstrap the value using the value function approximator
+        # once the pending captures are resolved.
+        if depth == self.depth_limit:
+            score = self.quiescence_search(agent, color, alpha, beta)
+            self.undo_temporary_move()
+            return score
 
-        # If the max depth is reached, bootstrap the value using the value function approximator.
-        if depth == self.search_depth:
-            features = self.compute_features()
-            self.board.undo_temporary_update(undo_key)
-            return self.evaluate(features), features
+        legal_moves = self.generate_moves(color, depth, hash_move)
 
         if agent == 'min':
             best_score = float('inf')
         elif agent == 'max':
             best_score = float('-inf')
 
-        for next_move in legal_moves:
-            if sequential_jumps:
-                score, leaf_features = self.minimax_search(next_move, next_agent, color, depth)
+        alpha_orig, beta_orig = alpha, beta
+        best_move = None
+
+        for i, next_move in enumerate(legal_moves):
+            if i == 0:
+                score = self.minimax_search(next_move, next_agent, next_color, depth+1, alpha, beta)
             else:
-                score, leaf_features = self.minimax_search(next_move, next_agent, next_color, depth+1)
+                score = self.principal_variation_search(next_move, next_agent, next_color, depth+1, alpha, beta)
 
             if agent == 'min' and score < best_score:
-                best_score  = score
-                pv_features = leaf_features
+                best_score = score
+                best_move  = next_move
+                beta       = min(beta, score)
+                self.pv_table[ply] = (next_move,) + self.pv_table[ply + 1]
             elif agent == 'max' and score > best_score:
-                best_score  = score
-                pv_features = leaf_features
+                best_score = score
+                best_move  = next_move
+                alpha      = max(alpha, score)
+                self.pv_table[ply] = (next_move,) + self.pv_table[ply + 1]
+
+            if self.search_aborted:
+                break
+
+            # The other agent already has a better option elsewhere, so the rest of the moves
+            # cannot affect the result.
+            if alpha >= beta:
+                self.move_orderer.record_cutoff(next_move, depth, draft, i)
+                break
+
+        if self.search_aborted:
+            self.undo_temporary_move()
+            return best_score
+
+        if best_score <= alpha_orig:
+            bound = TT_UPPER
+        elif best_score >= beta_orig:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+
+        self.tt.store(key, draft, best_score, bound, best_move.code, self.model.version)
+
+        self.undo_temporary_move()
+
+        return best_score
+
+
+    def quiescence_search(self, agent, color, alpha, beta):
+        '''
+        Searches the captures available to the player of color 'color' in the current position,
+        and those that follow, until the position is quiet, so that the evaluation function never
+        scores a position with a capture pending. A player with no capture stands pat and the
+        position is evaluated as it is. Captures are mandatory, so otherwise every jump sequence
+        has to be searched. Once the quiescence budget of the search is spent, positions are
+        evaluated as they are.
+
+        It works on the position on the board and leaves its principal variation in the table
+        like minimax_search().
+        '''
+
+        ply = self.ply
+        self.pv_table[ply] = ()
+
+        if self.quiescence_nodes >= self.quiescence_budget:
+            return self.evaluate_board()
+
+        jumps = self.board.get_jump_sequences(color)
+        if not jumps:
+            return self.evaluate_board()
+
+        next_agent = 'min' if agent == 'max' else 'max'
+        next_color = 'white' if color == 'black' else 'black'
+        best_score = float('-inf') if agent == 'max' else float('inf')
+
+        self.move_orderer.order(jumps, self.depth_limit)
+
+        for move in jumps:
+            self.nodes_searched   += 1
+            self.quiescence_nodes += 1
+
+            if self.deadline and not self.nodes_searched % 64 and time.perf_counter() >= self.deadline:
+                self.search_aborted = True
+            if self.search_aborted:
+                break
+
+            self.make_temporary_move(move)
+
+            if self.board.game_over:
+                score = self.evaluate_board()
+                self.pv_table[ply + 1] = ()
+
+            # A player with no possible moves loses the game.
+            elif not self.board.has_legal_moves(next_color):
+                score = -1 if self.color == next_color else 1
+                self.pv_table[ply + 1] = ()
+
+            else:
+                score = self.quiescence_search(next_agent, next_color, alpha, beta)
+
+            self.undo_temporary_move()
+
+            if agent == 'min' and score < best_score:
+                best_score = score
+                beta       = min(beta, score)
+                self.pv_table[ply] = (move,) + self.pv_table[ply + 1]
+            elif agent == 'max' and score > best_score:
+                best_score = score
+                alpha      = max(alpha, score)
+                self.pv_table[ply] = (move,) + self.pv_table[ply + 1]
+
+            if alpha >= beta:
+                break
+
+        return best_score
+
+
+    def generate_moves(self, color, depth, hash_move):
+        '''
+        Yields the moves of a search node in the order they have to be searched. Jumps are
+        mandatory and are searched as complete jump sequences. Otherwise the moves come in
+        stages: the hash move and the killer moves of the depth, if they are legal, and then the
+        rest of the moves ordered by the move orderer. Each stage is only generated if the ones
+        before it did not cause a cutoff.
+        '''
+
+        jumps = self.board.get_jump_sequences(color)
+        if jumps:
+            self.move_orderer.order(jumps, depth, hash_move)
+            yield from jumps
+            return
+
+        searched = []
+
+        for code in [hash_move] + self.move_orderer.killers[depth]:
+            if code < 0 or code in searched:
+                continue
 
-        self.board.undo_temporary_update(undo_key)
+            move = self.board.get_legal_move(code, color)
+            if move:
+                searched.append(code)
+                yield move
 
-        return best_score, pv_features
+        legal_moves = [ move for move in self.board.iter_legal_moves(color) if move.code not in searched ]
+
+        self.move_orderer.order(legal_moves, depth)
+        yield from legal_moves
 
 
     def update_loss(self):
@@ -267,12 +1082,31 @@ class MLPlayer(Player):
         if self.train:
             loosing_features = self.compute_features()
             next_state = State(self.evaluate(loosing_features), np.array(loosing_features))
-            self.model.td_lambda(self.prev_state, next_state)
+            if self.trajectory is not None:
+                self.trajectory.append(next_state)
+            else:
+                self.model.td_lambda(self.prev_state, next_state)
 
             if not self.no_records:
                 self.add_record(loosing_features, self.evaluate(loosing_features))
              
 
+    def learn_trajectory(self, trajectory):
+        '''
+        Updates the model with the states that a copy of the player went through in a game played
+        elsewhere, as make_move() and update_loss() would have done during the game, and adds
+        their records.
+        '''
+
+        prev_state = None
+        for next_state in trajectory:
+            self.model.td_lambda(prev_state, next_state)
+            prev_state = next_state
+
+            if not self.no_records:
+                self.add_record(next_state.features, next_state.score)
+
+
     def add_record(self, x, y):
         '''
         Adds record for a board position and its calculated score.
@@ -317,6 +1151,16 @@ class MLPlayer(Player):
         np.savetxt(records_file, full_records, delimiter=',', fmt='%1.4f')
 
 
+    def close(self):
+        '''
+        Stops the processes of the root search pool, if there is one.
+        '''
+
+        if self.search_pool is not None:
+            self.search_pool.close()
+            self.search_pool = None
+
+
     def reset(self):
         '''
         Does resets some variables in the model that depend on the current game and
@@ -324,6 +1168,8 @@ class MLPlayer(Player):
         '''
 
         self.model.reset()
+        self.move_orderer.reset_stats()
+        self.reset_search_stats()
 
         if not self.no_records:
             self.save_records(cycle=self.curr_cycle)
@@ -373,16 +1219,33 @@ class LinearModelPlayer(MLPlayer):
                     if (col % 2 == 0 and row % 2 == 0) or (col % 2 == 1 and row % 2 == 1):
                         self.features.append(features.PositionValueFeature(col, row, self.color))
 
+        self.feature_extractor   = features.VectorizedFeatureExtractor(self.color)
+        self.evaluator = PieceSquareEvaluator(self.features)
 
 
     def compute_features(self):
         '''
         Computes the features of the board according to the current state.
         '''
-        
+
+        if self.board.debug:
+            self.check_feature_extractor()
+
         return [ f.compute_value(self.board) for f in self.features ]
 
 
+    def check_feature_extractor(self):
+        '''
+        Verifies the vectorized feature extractor against the reference features.
+        '''
+
+        values   = self.feature_extractor.extract( self.feature_extractor.board_to_array(self.board) )
+        expected = [ f.compute_value(self.board) for f in self.features ]
+
+        if list(values) != expected:
+            raise RuntimeError('Vectorized features do not match the reference ones: {}'.format(self.board))
+
+
     def set_model(self):
         '''
         Initialize a new linear regression model or load existing one from 'save_file'.
@@ -429,3 +1292,31 @@ class LinearModelPlayer(MLPlayer):
             return 1 
 
         return super().evaluate(x)
+
+
+    # Override
+    def evaluate_board(self):
+        '''
+        Evaluates the current board state with the piece-square evaluator, applying the same
+        predefined values for terminal states as evaluate().
+        '''
+
+        if self.board.game_over == 3:
+            return 0
+
+        if self.color == 'black':
+            own_tiles, opponent_tiles = (board.BLACK_PAWN, board.BLACK_KING), (board.WHITE_PAWN, board.WHITE_KING)
+        else:
+            own_tiles, opponent_tiles = (board.WHITE_PAWN, board.WHITE_KING), (board.BLACK_PAWN, board.BLACK_KING)
+
+        counts = self.board.piece_counts
+        if not counts[own_tiles[0]] + counts[own_tiles[1]]:
+            return -1
+        elif not counts[opponent_tiles[0]] + counts[opponent_tiles[1]]:
+            return 1
+
+        # The evaluation tables are compiled again whenever the model weights are replaced.
+        if self.evaluator.coefs is not self.model.coefs_:
+            self.evaluator.compile(self.model.coefs_)
+
+        return self.evaluator.evaluate(self.board)
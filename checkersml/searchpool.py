@@ -0,0 +1,151 @@
+import multiprocessing
+
+from . import board
+from . import model
+
+
+####### WORKER PROCESSES #######
+
+# The player that searches the root moves sent to the worker process it lives in.
+worker_player = None
+
+
+def init_worker(player_class, color, config, shared_parameters):
+    '''
+    Creates the player of a worker process, with a board, transposition table and move orderer
+    of its own, and gives it the weights published to the shared parameters block.
+    '''
+
+    global worker_player
+
+    b = board.Board()
+    worker_player = player_class(color, b, **config)
+    worker_player.shared_parameters = shared_parameters
+    shared_parameters.read(worker_player.model)
+
+    # The game is over when the opponent of the player in turn has no pieces left, and that
+    # is the player searching, as on the board the search was requested from.
+    b.player_in_turn = worker_player
+
+
+def search_move(task):
+    '''
+    Searches the root move with the given code from the given board snapshot, and returns its
+    score, its principal variation and the number of nodes searched. The score is exact if it
+    is greater than the given alpha.
+    '''
+
+    snapshot, code, depth, alpha = task
+
+    agent = worker_player
+    agent.shared_parameters.update(agent.model)
+    agent.board.set_snapshot(snapshot)
+
+    for move in agent.board.get_all_compound_moves(agent.color):
+        if move.code == code:
+            break
+    else:
+        raise RuntimeError('The move {} is not legal in the position sent to the worker.'.format(code))
+
+    agent.nodes_searched = 0
+    agent.depth_limit    = depth
+    agent.move_orderer.new_search()
+
+    score, pv = agent.search_move(move, alpha)
+
+    return score, pv, agent.nodes_searched
+
+
+
+####### ROOT SEARCH POOL #######
+
+class RootSearchPool:
+    '''
+    Root search pool class
+
+    Searches the root moves of a player in a pool of processes, each one with a copy of the
+    player. The moves are sent as their codes along with a snapshot of the board, and the
+    weights of the model are published to a SharedParameters block before every search, so the
+    workers always search with the same weights as the player.
+
+    The first move is searched on its own with the whole window, and the rest of them at once
+    with its score as the lower bound, since most of them are not expected to be better. The
+    best move is the first one in the order of the legal moves with the highest score, which
+    is also the one a sequential alpha-beta search picks, since it only replaces its best move
+    with a strictly better one. Every root move has a quiescence budget of its own in both
+    searches, but the moves are searched with other windows and move ordering tables, so
+    scores only match while no budget runs out, and principal variations may differ between
+    lines with the same score.
+    '''
+
+    def __init__(self, agent, processes, config):
+        '''
+        'config' holds the keyword arguments to create the players of the workers with, which
+        must search like 'agent'.
+        '''
+
+        self.shared_parameters = model.SharedParameters(agent.model)
+        self.published_version = agent.model.version
+        self.published_arrays  = [ getattr(agent.model, name) for name in agent.model.parameters ]
+
+        self.pool = multiprocessing.Pool( processes, initializer = init_worker,
+                                          initargs = (type(agent), agent.color, config, self.shared_parameters) )
+
+
+    def search_root(self, agent, legal_moves):
+        '''
+        Searches the given root moves of the player up to its depth limit and returns a tuple
+        with the best score, the best move and the principal variation, like
+        MLPlayer.search_root() does.
+        '''
+
+        self.publish(agent.model)
+
+        snapshot = agent.board.get_snapshot()
+        depth    = agent.depth_limit
+
+        best_move = legal_moves[0]
+        best_score, move_pv, nodes = self.pool.apply( search_move, ((snapshot, best_move.code, depth, float('-inf')),) )
+        agent.nodes_searched += nodes
+
+        pv    = (best_move,) + move_pv[1:]
+        tasks = [ (snapshot, move.code, depth, best_score) for move in legal_moves[1:] ]
+
+        # Scores not greater than the one of the first move are only bounds, but those moves are
+        # not picked anyway.
+        for move, (score, move_pv, nodes) in zip( legal_moves[1:], self.pool.imap(search_move, tasks) ):
+            agent.nodes_searched += nodes
+
+            if score > best_score:
+                best_score = score
+                best_move  = move
+                pv         = (move,) + move_pv[1:]
+
+        return best_score, best_move, pv
+
+
+    def publish(self, agent_model):
+        '''
+        Publishes the weights of the model to the workers if they changed since they were last
+        published. Models get new arrays when their weights change, and the workers compile their
+        evaluators again whenever they read new weights.
+        '''
+
+        arrays = [ getattr(agent_model, name) for name in agent_model.parameters ]
+
+        if agent_model.version == self.published_version and all( a is b for a, b in zip(arrays, self.published_arrays) ):
+            return
+
+        self.shared_parameters.publish(agent_model)
+        self.published_version = agent_model.version
+        self.published_arrays  = arrays
+
+
+    def close(self):
+        '''
+        Stops the worker processes and releases the shared parameters block.
+        '''
+
+        self.pool.terminate()
+        self.pool.join()
+        self.shared_parameters.close()
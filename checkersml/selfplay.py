@@ -0,0 +1,168 @@
+import time
+import queue
+import random
+import multiprocessing
+import numpy as np
+
+from . import board
+from . import player
+
+
+####### MESSAGES #######
+
+# Kinds of the messages sent by the actors to the learner.
+GAME_PLAYED = 0
+ACTOR_DONE  = 1
+
+# Kinds of the messages sent by the learner to the actors.
+STOP = 1
+
+
+
+####### SELF-PLAY ACTOR #######
+
+class SelfPlayActor:
+    '''
+    Self-play actor class
+
+    Plays training games in a process of its own with a copy of the trainee model, and sends
+    the trajectory of the trainee in every game, the search score and the features of each
+    state it went through, to the learner through the shared results queue. The learner is the
+    only one to update the model and publishes the new weights to a SharedParameters block,
+    from which the trainee picks the latest ones before every move.
+
+    The object is created by the learner and copied into the actor process, so both can use its
+    queues and the shared block.
+    '''
+
+    def __init__(self, worker_id, trainee_config, opponent_config, shared_parameters, results):
+        '''
+        The configs are the keyword arguments of the LinearModelPlayer of the trainee, who plays
+        black, and of its opponent.
+        '''
+
+        self.worker_id         = worker_id
+        self.trainee_config    = trainee_config
+        self.opponent_config   = opponent_config
+        self.shared_parameters = shared_parameters
+        self.results           = results
+        self.inbox             = multiprocessing.Queue()
+
+
+    def stop(self):
+        '''
+        Asks the actor to stop once the game in progress is over. Called from the learner process.
+        '''
+
+        self.inbox.put( (STOP,) )
+
+
+    def run(self):
+        '''
+        Plays games until asked to stop. This is the entry point of the actor process.
+        '''
+
+        seed_process()
+
+        try:
+            b = board.Board()
+            trainee  = player.LinearModelPlayer('black', b, **self.trainee_config)
+            opponent = player.LinearModelPlayer('white', b, **self.opponent_config)
+
+            trainee.shared_parameters = self.shared_parameters
+
+            while self.receive():
+                version = trainee.model.version
+                outcome, turn_count, elapsed, scores, features = play_trajectory(b, trainee, opponent)
+
+                self.results.put( (GAME_PLAYED, self.worker_id, version, outcome, turn_count, elapsed, scores, features) )
+
+        except KeyboardInterrupt:
+            return
+
+        self.results.put( (ACTOR_DONE, self.worker_id) )
+
+
+    def receive(self):
+        '''
+        Handles the messages in the inbox, and returns False if the actor was asked to stop.
+        '''
+
+        while True:
+            try:
+                message = self.inbox.get_nowait()
+            except queue.Empty:
+                return True
+
+            if message[0] == STOP:
+                return False
+
+
+
+####### GAMES #######
+
+def seed_process():
+    '''
+    Seeds the random number generators of an actor process from fresh entropy. Processes forked
+    from the same parent would otherwise play the very same games.
+    '''
+
+    random.seed()
+    np.random.seed()
+
+
+def play_trajectory(b, trainee, opponent):
+    '''
+    Plays a full game, recording the trajectory of the trainee instead of learning from it,
+    and returns its outcome for the trainee, the number of turns played, the time it took, and
+    the search score and the features of every state the trainee went through.
+    '''
+
+    trainee.trajectory = []
+
+    start = time.perf_counter()
+    outcome, turn_count = play_game(b, trainee, opponent)
+    elapsed = time.perf_counter() - start
+
+    scores   = np.array([ state.score for state in trainee.trajectory ])
+    features = np.array([ state.features for state in trainee.trajectory ])
+
+    return outcome, turn_count, elapsed, scores, features
+
+
+def play_game(b, trainee, opponent):
+    '''
+    Plays a full game on board 'b', starting from a new board, and returns its outcome for the
+    trainee along with the number of turns played. The loser is told with update_loss().
+    '''
+
+    b.__init__()
+    b.set_players(trainee, opponent)
+    trainee.reset()
+
+    turn_count = 0
+
+    while not b.game_over:
+
+        turn_count += 1
+
+        move = b.player_in_turn.make_move()
+
+        # It is illegal to pass turn in Checkers.
+        if not move:
+            raise ValueError("Player didn't pick a move.")
+
+        try:
+            b.update(move)
+        except ValueError:
+            pass
+
+    if b.game_over == 3:
+        return 'Tie', turn_count
+
+    if b.player_in_turn.color == trainee.color:
+        opponent.update_loss()
+        return 'Win', turn_count
+
+    trainee.update_loss()
+    return 'Loss', turn_count
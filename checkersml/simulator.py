@@ -0,0 +1,327 @@
+import numpy as np
+
+from . import board
+from . import features
+
+
+####### MOVE TABLES #######
+
+# Tile value of the extra column that stands for the squares off the board.
+OFF_BOARD = features.VectorizedFeatureExtractor.OFF_BOARD
+
+# Codes of the finished games, as in Board.game_over: the opponent of the player in turn lost
+# all of its pieces, the player in turn was left without moves, or nobody captured for too long.
+NO_PIECES_LEFT = 1
+NO_MOVES_LEFT  = 2
+TIE            = 3
+
+# Every hop of a piece is the square it leaves times 4 plus its direction, for the steps, and
+# that plus 128 for the jumps. Squares off the board are square 32.
+HOPS = 256
+
+_steps = np.array([ [ 32 if t == -1 else t for t in row ] for row in board.STEP_TABLE ])
+_jumps = np.array([ [ 32 if t == -1 else t for t in row ] for row in board.JUMP_TABLE ])
+
+HOP_SOURCES      = np.tile( np.repeat(np.arange(32), 4), 2 )
+HOP_DIRECTIONS   = np.tile( np.arange(4), 64 )
+HOP_JUMPED       = np.concatenate( (np.full(128, 32), _steps.ravel()) )
+HOP_DESTINATIONS = np.concatenate( (_steps.ravel(), _jumps.ravel()) )
+HOP_CAPTURES     = np.arange(HOPS) >= 128
+
+# Tables indexed by the color to move, 0 for black and 1 for white.
+PAWN_HOPS = np.array([ np.isin(HOP_DIRECTIONS, board.BLACK_PAWN_DIRECTIONS),
+                       np.isin(HOP_DIRECTIONS, board.WHITE_PAWN_DIRECTIONS) ])
+PROMOTION_SQUARES = np.array([ board.BLACK_PROMOTION_SQUARES + (False,),
+                               board.WHITE_PROMOTION_SQUARES + (False,) ])
+PAWN_DIRECTIONS = np.array([ np.isin(np.arange(4), board.BLACK_PAWN_DIRECTIONS),
+                             np.isin(np.arange(4), board.WHITE_PAWN_DIRECTIONS) ])
+
+COLORS = ('black', 'white')
+SIGNS  = np.array([1, -1], dtype=np.int8)
+
+
+
+####### BATCH SIMULATOR #######
+
+class BatchSimulator:
+    '''
+    Batch simulator class
+
+    Plays K games of checkers in lockstep with NumPy operations over all of them at once, for
+    generating data much faster than one Board at a time. The games are held as a (K, 33) np.int8
+    array of tile values in bitboard order, with an extra column off the board, along with
+    vectors of the color to move, the square a piece must keep jumping from, the turn counts,
+    the turns without captures and the game over codes.
+
+    Every step plays one hop in each game that is not over, following the rules of Board.update
+    to the letter: jumps are mandatory, a piece that captured keeps jumping while it can, a pawn
+    that reaches the far row is promoted and may keep jumping as a king, and games end when a
+    player loses all of its pieces or its moves, or in a tie after more than 50 turns without
+    captures once 50 turns have been played.
+
+    Each color picks its hops at random, or with a linear model over the features of the
+    position every legal hop leads to, exploring at random with probability 'epsilon' like
+    LinearModelPlayer does.
+    '''
+
+    def __init__(self, games, seed=None):
+
+        self.games  = games
+        self.random = np.random.RandomState(seed)
+
+        self.policies   = [ (None, 1), (None, 1) ]
+        self.extractors = [ features.VectorizedFeatureExtractor(color) for color in COLORS ]
+
+        self.reset()
+
+
+    def reset(self):
+        '''
+        Sets every game back to the initial position with black to move.
+        '''
+
+        initial = board.Board().get_position()
+        tiles   = features.VectorizedFeatureExtractor.positions_to_arrays([initial])[0]
+
+        self.tiles = np.full( (self.games, 33), OFF_BOARD, dtype=np.int8 )
+        self.tiles[:, :32] = tiles
+
+        # Colors are 0 for black and 1 for white, and the winner is -1 until a player wins.
+        self.turn          = np.zeros(self.games, dtype=np.int8)
+        self.jump_square   = np.full(self.games, -1, dtype=np.int8)
+        self.turn_count    = np.zeros(self.games, dtype=np.int32)
+        self.no_jump_count = np.zeros(self.games, dtype=np.int32)
+        self.game_over     = np.zeros(self.games, dtype=np.int8)
+        self.winner        = np.full(self.games, -1, dtype=np.int8)
+
+        self.positions  = 0
+        self.legal_hops = self.get_legal_hops( np.arange(self.games) )
+
+
+    def set_policy(self, color, coefs=None, epsilon=1):
+        '''
+        Makes the given color pick its hops with the coefficients of a linear model over the
+        features of its LinearModelPlayer, or at random when 'coefs' is None.
+        '''
+
+        if color not in COLORS:
+            raise ValueError('Unknown color \'{}\'.'.format(color))
+
+        self.policies[ COLORS.index(color) ] = (coefs, epsilon)
+
+
+    def get_squares(self):
+        '''
+        Returns the (K, 32) array of tile values of the games.
+        '''
+
+        return self.tiles[:, :32]
+
+
+    def get_active(self):
+        '''
+        Returns the indices of the games that are not over.
+        '''
+
+        return np.flatnonzero(self.game_over == 0)
+
+
+    def extract_features(self, color, games=None):
+        '''
+        Returns the features of the given games, or of all of them, as seen by the
+        LinearModelPlayer of the given color.
+        '''
+
+        squares = self.tiles[:, :32] if games is None else self.tiles[games, :32]
+
+        return self.extractors[ COLORS.index(color) ].extract(squares)
+
+
+    def get_legal_hops(self, games):
+        '''
+        Returns a (len(games), 256) boolean array with the legal hops of the player to move in
+        each of the given games.
+        '''
+
+        tiles  = self.tiles[games]
+        turn   = self.turn[games]
+        side   = SIGNS[turn][:, None]
+        pieces = tiles[:, HOP_SOURCES[128:]] * side
+
+        # The steps and the jumps of a piece go along the same directions, so they are checked
+        # together. Squares off the board are never empty.
+        movers  = (pieces == 3) | ( (pieces == 1) & PAWN_HOPS[turn, 128:] )
+        next_to = tiles[:, HOP_JUMPED[128:]]
+        landing = tiles[:, HOP_DESTINATIONS[128:]] == board.EMPTY
+
+        steps = movers & (next_to == board.EMPTY)
+        jumps = movers & (next_to * side < 0) & landing
+
+        # A piece in the middle of a sequence of jumps must keep jumping.
+        jumping = self.jump_square[games][:, None]
+        jumps  &= (jumping < 0) | (HOP_SOURCES[128:] == jumping)
+
+        # Jumps are mandatory.
+        steps[ jumps.any(axis=1) ] = False
+
+        return np.concatenate( (steps, jumps), axis=1 )
+
+
+    def step(self):
+        '''
+        Plays one hop in every game that is not over, and returns the indices of those games
+        along with the hops played.
+        '''
+
+        games = self.get_active()
+        legal = self.legal_hops
+
+        hops = np.empty(len(games), dtype=np.int64)
+        for turn in (0, 1):
+            mask = self.turn[games] == turn
+            if mask.any():
+                hops[mask] = self.choose_hops( games[mask], legal[mask], turn )
+
+        self.play_hops(games, hops)
+
+        return games, hops
+
+
+    def run(self):
+        '''
+        Plays every game until it is over, and returns the number of positions played.
+        '''
+
+        start = self.positions
+        while self.game_over.min() == 0:
+            self.step()
+
+        return self.positions - start
+
+
+    def choose_hops(self, games, legal, turn):
+        '''
+        Picks one of the legal hops of each of the given games for the color with the given
+        turn, according to its policy.
+        '''
+
+        coefs, epsilon = self.policies[turn]
+
+        # Picks the n-th legal hop of each game with n uniform below the number of them.
+        counts = np.count_nonzero(legal, axis=1)
+        picks  = ( self.random.random_sample(len(games)) * counts ).astype(np.int16)
+        hops   = ( np.cumsum(legal, axis=1, dtype=np.int16) > picks[:, None] ).argmax(axis=1)
+
+        if coefs is None:
+            return hops
+
+        greedy = self.random.random_sample(len(games)) >= epsilon
+        if greedy.any():
+            hops[greedy] = self.choose_best_hops( games[greedy], legal[greedy], turn, coefs )
+
+        return hops
+
+
+    def choose_best_hops(self, games, legal, turn, coefs):
+        '''
+        Picks the legal hop of each of the given games that leads to the position with the best
+        score for the color with the given turn, the first one in case of a tie.
+        '''
+
+        rows, hops = np.nonzero(legal)
+        after      = self.tiles[ games[rows] ]
+        self.move_pieces( after, np.arange(len(rows)), hops )
+
+        X = self.extractors[turn].extract( after[:, :32] )
+        scores = X @ coefs
+
+        # Positions with no opponent pieces left are won, and score 1 like in evaluate().
+        scores[ X[:, 1] == 0 ] = 1
+
+        # The hops are sorted by game, so the best of each is the first one of its group after
+        # a stable sort by score within the groups.
+        order = np.lexsort( (-scores, rows) )
+        first = np.flatnonzero( np.diff(rows[order], prepend=-1) )
+
+        return hops[ order[first] ]
+
+
+    def move_pieces(self, tiles, rows, hops):
+        '''
+        Moves the pieces of the given hops in the given rows of a tiles array, capturing and
+        promoting them as needed, and returns the squares they land on.
+        '''
+
+        sources      = HOP_SOURCES[hops]
+        destinations = HOP_DESTINATIONS[hops]
+        pieces       = tiles[rows, sources]
+
+        # Pawns that reach the far row of their color are promoted. Only black pawns promote on
+        # the black promotion squares, and white pawns on the white ones.
+        promoted = ( ((pieces == board.BLACK_PAWN) & PROMOTION_SQUARES[0][destinations]) |
+                     ((pieces == board.WHITE_PAWN) & PROMOTION_SQUARES[1][destinations]) )
+
+        tiles[rows, sources]          = board.EMPTY
+        tiles[rows, HOP_JUMPED[hops]] = board.EMPTY
+        tiles[rows, destinations]     = np.where(promoted, 3 * pieces, pieces)
+
+        # Steps "capture" the tile off the board, which must stay there.
+        tiles[:, 32] = OFF_BOARD
+
+        return destinations
+
+
+    def play_hops(self, games, hops):
+        '''
+        Plays the given hops in the given games and updates their state like Board.update does.
+        '''
+
+        self.positions += len(games)
+
+        destinations = self.move_pieces( self.tiles, games, hops )
+        captures     = HOP_CAPTURES[hops]
+
+        turn = self.turn[games]
+        side = SIGNS[turn][:, None]
+
+        # The player in turn wins if its opponent has no pieces left.
+        opponents = np.count_nonzero( self.tiles[games, :32] * side < 0, axis=1 )
+        won       = opponents == 0
+
+        self.game_over[ games[won] ] = NO_PIECES_LEFT
+        self.winner[ games[won] ]    = turn[won]
+
+        # A piece that captured keeps jumping if it still can, as a king if it was promoted.
+        pieces  = self.tiles[games, destinations] * side[:, 0]
+        jumped  = self.tiles[ games[:, None], _steps[destinations] ] * side
+        landing = self.tiles[ games[:, None], _jumps[destinations] ] == board.EMPTY
+        movable = (pieces == 3)[:, None] | PAWN_DIRECTIONS[turn]
+
+        can_jump = ( movable & (jumped < 0) & (jumped != -OFF_BOARD) & landing ).any(axis=1)
+        go_on    = captures & can_jump & ~won
+        ended    = ~captures | ~can_jump
+
+        self.jump_square[ games[go_on] ] = destinations[go_on]
+
+        passing = games[ended & ~won]
+        self.jump_square[passing] = -1
+        self.turn[passing]       ^= 1
+        self.turn_count[passing] += 1
+
+        quiet = (self.turn_count[passing] > 50) & ~captures[ended & ~won]
+        self.no_jump_count[passing] = np.where( quiet, self.no_jump_count[passing] + 1, 0 )
+
+        # The next player loses if it has no moves left, but the game is a tie if too many
+        # turns went by without captures.
+        playing = games[~won]
+        legal   = self.get_legal_hops(playing)
+        blocked = ~legal.any(axis=1)
+
+        self.game_over[ playing[blocked] ] = NO_MOVES_LEFT
+        self.winner[ playing[blocked] ]    = self.turn[ playing[blocked] ] ^ 1
+
+        tied = self.no_jump_count[playing] > 50
+        self.game_over[ playing[tied] ] = TIE
+        self.winner[ playing[tied] ]    = -1
+
+        self.legal_hops = legal[ self.game_over[playing] == 0 ]
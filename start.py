@@ -6,11 +6,12 @@ if sys.version_info < (3, 4):
     sys.exit(1)
 
 import os
-import time
 import logging
+import tracemalloc
 import datetime
 import argparse
 
+from checkersml.board import Board
 from checkersml.controller import CheckersController
 
 
@@ -22,10 +23,24 @@ def main():
     args   = parse_arguments()
     logger = setup_logger(args.debug, args.nolog)
 
-    controller = CheckersController(args.notrain, args.nodata)
+    Board.debug             = args.debug
+    Board.trace_allocations = args.tracealloc
+
+    if args.tracealloc:
+        tracemalloc.start()
+
+    controller = CheckersController(args.notrain, args.nodata, args.movetime, args.searchers)
 
     if args.play != None:
         controller.play(args.play)
+    elif args.simulate:
+        controller.simulate(args.simulate)
+    elif args.connect:
+        controller.join_training(args.connect)
+    elif args.train != None and args.serve:
+        controller.train_server(args.train, args.serve, args.workers or 0)
+    elif args.train != None and args.workers:
+        controller.train_parallel(args.train, args.workers)
     elif args.train != None:
         controller.train(args.train)
     else:
@@ -47,18 +62,45 @@ def parse_arguments():
     parser.add_argument( '-notrain', action='store_true', help='Prevents training during real games.' )
     parser.add_argument( '-nolog', action='store_true', help='Prevents the program from generating logs.' )
     parser.add_argument( '-nodata', action='store_true', help='Stops training data from being saved to files.' )
-    parser.add_argument( '-debug', action='store_true', help='Enable debug messages.' )
+    parser.add_argument( '-workers', type=int,
+                         help='Train with this many self-play processes, learning from their games in the main one.' )
+    parser.add_argument( '-searchers', type=int, default=0,
+                         help='Split the root moves of the ML Player among this many processes in real games.' )
+    parser.add_argument( '-serve', type=parse_address, metavar='HOST:PORT',
+                         help='Train by learning from the games of actors connected to this address.' )
+    parser.add_argument( '-connect', type=parse_address, metavar='HOST:PORT',
+                         help='Play training games for the learner serving at this address.' )
+    parser.add_argument( '-simulate', type=int, metavar='K',
+                         help='Measure the throughput of K games played at once by the batch simulator.' )
+    parser.add_argument( '-movetime', type=int,
+                         help='Search time in milliseconds per move of the ML Player instead of a fixed depth.' )
+    parser.add_argument( '-debug', action='store_true', help='Enable debug messages and board consistency checks.' )
+    parser.add_argument( '-tracealloc', action='store_true',
+                         help='Measure the memory allocated by the board updates and the nodes of the ML Player searches.' )
 
     args = parser.parse_args()
 
-    if args.train is None and args.play is None:
-        print('Either the \'--play\' or \'--train\' options must be specified.\nPlease see usage:')
+    if args.train is None and args.play is None and args.connect is None and args.simulate is None:
+        print('Either the \'--play\', \'--train\', \'--connect\' or \'--simulate\' options must be specified.\nPlease see usage:')
         parser.print_help()
         sys.exit(1)
 
     return args
 
 
+def parse_address(text):
+    '''
+    Parses a network address given as HOST:PORT. The host may be left empty to listen on
+    every interface.
+    '''
+
+    host, _, port = text.rpartition(':')
+    if not port.isdigit():
+        raise argparse.ArgumentTypeError('\'{}\' is not a HOST:PORT address.'.format(text))
+
+    return host, int(port)
+
+
 def setup_logger(debug, no_log):
     '''
     Create and setup logger instance.
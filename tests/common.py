@@ -0,0 +1,91 @@
+import random
+
+import numpy as np
+
+from checkersml import board
+from checkersml import player
+
+
+class Opponent:
+    '''
+    Stands for a player that does not search, which the board only asks for its color.
+    '''
+
+    def __init__(self, color):
+        self.color = color
+
+
+def new_board():
+    '''
+    Returns a board in the initial position with two players that only have a color.
+    '''
+
+    b = board.Board()
+    b.set_players( Opponent('black'), Opponent('white') )
+
+    return b
+
+
+def play_random_games(games, seed=0, max_turns=120):
+    '''
+    Plays random games and yields the board before every move, along with the move that is
+    played next. The board must not be changed by the caller.
+    '''
+
+    rng = random.Random(seed)
+
+    for _ in range(games):
+        b = new_board()
+
+        while not b.game_over and b.turn_count < max_turns:
+            move = rng.choice( b.get_all_legal_moves(b.player_in_turn.color) )
+            yield b, move
+            b.update(move)
+
+
+def get_positions(count, color='black', seed=0):
+    '''
+    Returns the snapshots of positions with the given color to move, picked at random from
+    random games.
+    '''
+
+    rng       = random.Random(seed)
+    positions = []
+
+    for b, _ in play_random_games(10 * count, seed):
+        if b.player_in_turn.color == color and b.required_src is None and rng.random() < 0.1:
+            positions.append( b.get_snapshot() )
+            if len(positions) == count:
+                break
+
+    return positions
+
+
+def random_coefs(scale=1, seed=0):
+    '''
+    Returns random weights for the linear model of a LinearModelPlayer.
+    '''
+
+    return np.random.RandomState(seed).uniform(-1, 1, 38) * scale
+
+
+def make_player(tmp_path, b, coefs, color='black', **config):
+    '''
+    Returns a LinearModelPlayer with the given weights that saves its model in 'tmp_path'.
+    '''
+
+    agent = player.LinearModelPlayer( color, b, save_file=str(tmp_path / 'model.pickle'), **config )
+    agent.model.coefs_  = coefs.copy()
+    agent.model.version = 1
+
+    return agent
+
+
+def set_search_position(agent, snapshot):
+    '''
+    Sets up the board of a player to search from the given snapshot, with the player in turn.
+    '''
+
+    agent.board.set_snapshot(snapshot)
+    agent.board.player_in_turn = agent
+    agent.move_orderer.new_search()
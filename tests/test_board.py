@@ -0,0 +1,399 @@
+import random
+
+import pytest
+
+from checkersml import board
+
+from .common import new_board, play_random_games
+
+
+####### REFERENCE IMPLEMENTATION #######
+
+# Moves along the grid of the original implementation, which worked on board.state directly.
+# Black pawns go down the rows and white pawns up.
+DIRECTIONS = { board.BLACK_PAWN : ((-1, 1), (1, 1)),
+               board.WHITE_PAWN : ((-1, -1), (1, -1)),
+               board.BLACK_KING : ((-1, 1), (1, 1), (-1, -1), (1, -1)),
+               board.WHITE_KING : ((-1, 1), (1, 1), (-1, -1), (1, -1)) }
+
+
+def reference_piece_moves(state, x, y):
+    '''
+    Returns the (src, dst, capture, promote) tuples of the moves of the piece on (x, y).
+    '''
+
+    piece = state[y][x]
+    moves = []
+
+    for dx, dy in DIRECTIONS.get(piece, ()):
+        for distance in (1, 2):
+            nx, ny = x + distance * dx, y + distance * dy
+            if not (0 <= nx <= 7 and 0 <= ny <= 7):
+                break
+
+            if distance == 2 and not state[y + dy][x + dx] * piece < 0:
+                break
+            if state[ny][nx] != board.EMPTY:
+                continue
+
+            promote = (piece == board.BLACK_PAWN and ny == 7) or (piece == board.WHITE_PAWN and ny == 0)
+            moves.append( ((x, y), (nx, ny), distance == 2, promote) )
+            break
+
+    return moves
+
+
+def reference_legal_moves(state, color, required_src=None):
+    '''
+    Returns the legal moves of a color like the original Board.get_all_legal_moves().
+    '''
+
+    sign  = 1 if color == 'black' else -1
+    moves = []
+
+    for y in range(8):
+        for x in range(8):
+            if state[y][x] * sign > 0:
+                moves += reference_piece_moves(state, x, y)
+
+    jumps = [ m for m in moves if m[2] ]
+    if jumps:
+        if required_src is not None:
+            jumps = [ m for m in jumps if m[0] == required_src ]
+        return jumps
+
+    return moves
+
+
+def reference_update(state, move):
+    '''
+    Returns a copy of the grid after a single move.
+    '''
+
+    (x, y), (nx, ny), capture, promote = move
+
+    state = [ list(row) for row in state ]
+    state[ny][nx] = state[y][x] * (3 if promote else 1)
+    state[y][x]   = board.EMPTY
+    if capture:
+        state[(y + ny) // 2][(x + nx) // 2] = board.EMPTY
+
+    return state
+
+
+def reference_jump_sequences(state, color):
+    '''
+    Returns the paths of every complete jump sequence of a color as tuples of squares, and
+    the grids they lead to.
+    '''
+
+    sequences = []
+
+    # A pawn that is promoted keeps jumping as a king, since the grid holds a king by then.
+    def extend(state, path):
+        jumps = [ m for m in reference_piece_moves(state, *path[-1]) if m[2] ]
+        if not jumps:
+            sequences.append( (tuple(path), state) )
+
+        for move in jumps:
+            extend( reference_update(state, move), path + [move[1]] )
+
+    for move in reference_legal_moves(state, color):
+        if move[2]:
+            extend( reference_update(state, move), [move[0], move[1]] )
+
+    return sequences
+
+
+def as_tuples(moves):
+    return sorted( (tuple(m.src), tuple(m.dst), m.capture, m.promote) for m in moves )
+
+
+def as_grid(b):
+    return [ list(row) for row in b.state ]
+
+
+####### TESTS #######
+
+def test_initial_moves_match_reference():
+
+    b = new_board()
+
+    for color in ('black', 'white'):
+        assert as_tuples( b.get_all_legal_moves(color, cache=False) ) == sorted( reference_legal_moves(b.state, color) )
+
+
+def test_legal_moves_match_reference():
+
+    positions = 0
+
+    for b, _ in play_random_games(40, seed=1):
+        color        = b.player_in_turn.color
+        opponent     = 'white' if color == 'black' else 'black'
+        required_src = tuple(b.required_src) if b.required_src else None
+        state        = as_grid(b)
+
+        assert as_tuples( b.get_all_legal_moves(color) ) == sorted( reference_legal_moves(state, color, required_src) )
+        assert as_tuples( b.get_all_legal_moves(opponent, cache=False) ) == sorted( reference_legal_moves(state, opponent) )
+        assert b.has_legal_moves(opponent) == bool( reference_legal_moves(state, opponent) )
+
+        positions += 1
+
+    assert positions > 1000
+
+
+def test_updates_match_reference():
+
+    rng = random.Random(5)
+
+    for _ in range(40):
+        b = new_board()
+
+        while not b.game_over and b.turn_count < 120:
+            color = b.player_in_turn.color
+            move  = rng.choice( b.get_all_legal_moves(color) )
+
+            expected = reference_update( as_grid(b), (tuple(move.src), tuple(move.dst), move.capture, move.promote) )
+            b.update(move)
+            assert as_grid(b) == expected
+
+            # The same piece keeps jumping while it can, as a king if it was just promoted.
+            if not b.game_over:
+                can_continue = move.capture and any( m[2] for m in reference_piece_moves(expected, *move.dst) )
+                assert ( b.player_in_turn.color == color ) == can_continue
+                assert ( b.required_src == move.dst ) == can_continue
+
+
+def test_jump_sequences_match_reference():
+
+    sequences = 0
+
+    for b, _ in play_random_games(40, seed=2):
+        color = b.player_in_turn.color
+        if b.required_src is not None:
+            continue
+
+        state    = as_grid(b)
+        expected = reference_jump_sequences(state, color)
+        moves    = b.get_jump_sequences(color)
+
+        paths = sorted( tuple( [tuple(m.src)] + [ tuple(hop.dst) for hop in getattr(m, 'hops', (m,)) ] ) for m in moves )
+        assert paths == sorted( path for path, _ in expected )
+
+        # Making a sequence leaves the board as playing its jumps one by one.
+        results = dict(expected)
+        for move in moves:
+            path = tuple( [tuple(move.src)] + [ tuple(hop.dst) for hop in getattr(move, 'hops', (move,)) ] )
+            b.temporary_update(move)
+            assert as_grid(b) == results[path]
+            b.undo_temporary_update()
+
+        sequences += len(moves)
+
+    assert sequences > 100
+
+
+def test_compound_moves_are_steps_or_jump_sequences():
+
+    for b, _ in play_random_games(10, seed=3):
+        color = b.player_in_turn.color
+        if b.required_src is not None:
+            continue
+
+        jumps = b.get_jump_sequences(color)
+        moves = b.get_all_compound_moves(color, cache=False)
+
+        if jumps:
+            assert [ m.code for m in moves ] == [ m.code for m in jumps ]
+        else:
+            assert as_tuples(moves) == as_tuples( b.get_all_legal_moves(color, cache=False) )
+
+
+def test_legal_moves_are_generated_once_per_turn():
+
+    for b, move in play_random_games(5, seed=11):
+        color = b.player_in_turn.color
+        moves = b.get_all_legal_moves(color)
+        kept  = b.turn_moves
+
+        assert b.get_all_legal_moves(color) == moves
+        assert b.turn_moves is kept
+
+        # Temporary updates never get the list of another position.
+        if b.required_src is None:
+            b.temporary_update(move)
+            assert as_tuples( b.get_all_legal_moves(color) ) == as_tuples( b.get_all_legal_moves(color, cache=False) )
+            b.undo_temporary_update()
+
+
+def test_update_lists_the_compound_moves_of_the_next_turn():
+
+    for b, _ in play_random_games(10, seed=12):
+        # The first turn of a game follows no update.
+        if b.turn_count == 0:
+            continue
+
+        color = b.player_in_turn.color
+        assert b.turn_sequences[:2] == (color, b.zobrist_key)
+        assert as_tuples( b.get_all_compound_moves(color) ) == as_tuples( b.get_all_compound_moves(color, cache=False) )
+
+        # Without jumps, the single moves are the compound moves kept by update().
+        moves = b.get_all_legal_moves(color)
+        if not moves[0].capture:
+            assert b.turn_moves is b.turn_sequences
+        assert as_tuples(moves) == as_tuples( b.get_all_legal_moves(color, cache=False) )
+
+
+def test_legal_move_lookup_by_code():
+
+    for b, _ in play_random_games(10, seed=4):
+        color = b.player_in_turn.color
+        moves = b.get_all_legal_moves(color, cache=False)
+
+        for move in moves:
+            assert b.get_legal_move(move.code, color) is move
+
+        # Steps cannot be looked up while a jump is available.
+        if moves[0].capture:
+            sign  = 1 if color == 'black' else -1
+            state = as_grid(b)
+            steps = [ m for y in range(8) for x in range(8) if state[y][x] * sign > 0
+                        for m in reference_piece_moves(state, x, y) if not m[2] ]
+
+            for src, dst, _, _ in steps:
+                code = board.coords_to_square(*src) * 32 + board.coords_to_square(*dst)
+                assert b.get_legal_move(code, color) is None
+
+
+def test_capture_map_matches_reference():
+
+    for b, _ in play_random_games(20, seed=11):
+        state = as_grid(b)
+        black_jumps, white_jumps, black_threatened, white_threatened = b.get_capture_map()
+
+        for color, jumps, threatened in (('black', white_jumps, black_threatened),
+                                         ('white', black_jumps, white_threatened)):
+            opponent = 'white' if color == 'black' else 'black'
+            captures = [ m for m in reference_legal_moves(state, opponent) if m[2] ]
+
+            jumpers  = { m[0] for m in captures }
+            captured = { ((x + nx) // 2, (y + ny) // 2) for (x, y), (nx, ny), _, _ in captures }
+
+            masks = 0
+            for mask in jumps:
+                masks |= mask
+
+            assert masks == sum( 1 << board.coords_to_square(*c) for c in jumpers )
+            assert threatened == sum( 1 << board.coords_to_square(*c) for c in captured )
+
+
+def test_game_ends_when_a_player_is_blocked():
+
+    # A black pawn on the last row but one, blocked by two white pawns it cannot jump.
+    state = [ [board.EMPTY] * 8 for _ in range(8) ]
+    state[5][1] = board.BLACK_PAWN
+    state[6][0] = board.WHITE_PAWN
+    state[6][2] = board.WHITE_PAWN
+    state[7][3] = board.WHITE_PAWN
+    state[0][6] = board.WHITE_PAWN
+
+    b = board.Board(state)
+    assert not b.has_legal_moves('black')
+    assert b.has_legal_moves('white')
+    assert b.get_all_legal_moves('black', cache=False) == []
+
+
+def test_rejects_illegal_moves():
+
+    b = new_board()
+
+    with pytest.raises(ValueError):
+        b.update( board.Move([0, 2], [0, 3]) )
+
+    # Only the pieces of the player in turn can be moved.
+    with pytest.raises(ValueError):
+        b.update( board.Move([1, 5], [0, 4]) )
+
+
+def get_state(b):
+    return ( b.get_snapshot(), b.zobrist_key, dict(b.piece_counts), b.game_over, b.undo_count )
+
+
+def test_temporary_updates_round_trip():
+
+    rng = random.Random(6)
+
+    for b, _ in play_random_games(20, seed=6):
+        if b.required_src is not None:
+            continue
+
+        before = get_state(b)
+        color  = b.player_in_turn.color
+
+        # Plays a random line of compound moves, checking the incremental state on the way, and
+        # takes it back.
+        for _ in range(6):
+            moves = b.get_all_compound_moves(b.color_to_move, cache=False)
+            if b.game_over or not moves:
+                break
+
+            b.temporary_update( rng.choice(moves) )
+            assert b.zobrist_key == b.compute_zobrist_key()
+            assert b.piece_counts == b._recount_pieces()
+
+        while b.undo_count:
+            b.undo_temporary_update()
+
+        assert get_state(b) == before
+        assert b.player_in_turn.color == color
+
+
+def test_zobrist_key_identifies_the_position():
+
+    keys = {}
+
+    for b, _ in play_random_games(20, seed=7):
+        snapshot = b.get_snapshot()
+        assert b.zobrist_key == b.compute_zobrist_key()
+        assert keys.setdefault(b.zobrist_key, snapshot) == snapshot
+
+    assert len(keys) > 1000
+
+
+def test_snapshots_restore_the_position():
+
+    other = new_board()
+
+    for b, _ in play_random_games(10, seed=5):
+        other.set_snapshot( b.get_snapshot() )
+
+        assert as_grid(other) == as_grid(b)
+        assert (other.color_to_move, other.jump_square) == (b.color_to_move, b.jump_square)
+        assert (other.zobrist_key, other.piece_counts) == (b.zobrist_key, b.piece_counts)
+
+        color = b.color_to_move
+        assert as_tuples( other.get_all_compound_moves(color) ) == as_tuples( b.get_all_compound_moves(color, cache=False) )
+
+
+def test_undo_checks_the_undo_stack():
+
+    b = new_board()
+    move = b.get_all_legal_moves('black')[0]
+
+    with pytest.raises(RuntimeError):
+        b.undo_temporary_update()
+
+    first  = b.temporary_update(move)
+    second = b.temporary_update( b.get_all_legal_moves('white', cache=False)[0] )
+
+    with pytest.raises(RuntimeError):
+        b.undo_temporary_update(first)
+
+    # A rejected undo leaves the stack as it was.
+    b.undo_temporary_update(second)
+    b.undo_temporary_update(first)
+    assert b.get_snapshot() == new_board().get_snapshot()
+
+    b.undo_count = board.UNDO_STACK_SIZE
+    with pytest.raises(RuntimeError):
+        b.temporary_update(move)
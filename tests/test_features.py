@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from checkersml import features
+
+from .common import make_player, new_board, play_random_games, random_coefs
+
+
+@pytest.mark.parametrize('color', ['black', 'white'])
+def test_vectorized_features_match_feature_classes(tmp_path, color):
+
+    agent     = make_player( tmp_path, new_board(), random_coefs(), color=color )
+    extractor = features.VectorizedFeatureExtractor(color)
+
+    grids     = []
+    positions = []
+    expected  = []
+
+    for b, _ in play_random_games(20, seed=8):
+        values = [ f.compute_value(b) for f in agent.features ]
+
+        assert list( extractor.extract(extractor.board_to_array(b)) ) == values
+
+        grids.append( extractor.board_to_array(b) )
+        positions.append( b.get_position() )
+        expected.append(values)
+
+    # Stacks of grids give one row for each.
+    X = extractor.extract( np.stack(grids) )
+    assert X.tolist() == expected
+
+    # And so do stacks of positions in bitboard order.
+    X = extractor.extract( extractor.positions_to_arrays(positions) )
+    assert X.tolist() == expected
+
+
+def test_positions_to_arrays_matches_the_grid():
+
+    extractor = features.VectorizedFeatureExtractor('black')
+
+    for b, _ in play_random_games(5, seed=9):
+        grid  = extractor.board_to_array(b)
+        tiles = extractor.positions_to_arrays([ b.get_position() ])[0]
+
+        assert ( grid[extractor.grid_rows, extractor.grid_cols] == tiles ).all()
+
+
+@pytest.mark.parametrize('color', ['black', 'white'])
+def test_piece_square_evaluator_matches_the_model(tmp_path, color):
+
+    b     = new_board()
+    agent = make_player( tmp_path, b, random_coefs(seed=3), color=color )
+
+    for game_board, _ in play_random_games(10, seed=10):
+        b.set_position( game_board.get_position() )
+
+        x = [ f.compute_value(b) for f in agent.features ]
+        assert agent.evaluate_board() == pytest.approx( agent.evaluate(np.array(x)) )
+
+    # New weights are picked up by the evaluator.
+    agent.model.coefs_ = random_coefs(seed=4)
+    x = [ f.compute_value(b) for f in agent.features ]
+    assert agent.evaluate_board() == pytest.approx( agent.evaluate(np.array(x)) )
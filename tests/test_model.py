@@ -0,0 +1,129 @@
+import pickle
+import threading
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from checkersml import model
+
+
+def new_model(coefs=None):
+
+    m = model.LinearRegressionModel(4, 0.1, 0, 0.5)
+    if coefs is not None:
+        m.coefs_ = np.array(coefs, dtype=np.float64)
+
+    return m
+
+
+@pytest.fixture
+def shared():
+
+    shared = model.SharedParameters( new_model([1, 2, 3, 4]) )
+    yield shared
+    shared.close()
+
+
+def read_version(shared, queue):
+    m = new_model()
+    shared.read(m)
+    queue.put( (m.version, m.coefs_.tolist()) )
+
+
+def test_read_gets_the_published_weights(shared):
+
+    writer = new_model([5, 6, 7, 8])
+    writer.version = 3
+    shared.publish(writer)
+
+    reader = new_model()
+    shared.read(reader)
+
+    assert reader.coefs_.tolist() == [5, 6, 7, 8]
+    assert reader.version == 3
+    assert shared.get_version() == 3
+
+    # The reader gets arrays of its own.
+    writer.coefs_[0] = 0
+    shared.publish(writer)
+    assert reader.coefs_[0] == 5
+
+
+def test_update_only_reads_new_publications(shared):
+
+    reader = new_model()
+    assert shared.update(reader)
+    assert not shared.update(reader)
+
+    arrays = reader.coefs_
+    shared.publish( new_model([0, 0, 0, 1]) )
+
+    assert shared.update(reader)
+    assert reader.coefs_ is not arrays
+    assert reader.coefs_.tolist() == [0, 0, 0, 1]
+
+
+def test_read_waits_for_a_publication_in_progress(shared):
+
+    # An odd sequence counter means that the weights are being written.
+    shared.header[0] += 1
+    shared.arrays[0][...] = 9
+
+    def finish():
+        shared.header[1] = 4
+        shared.header[0] += 1
+
+    timer = threading.Timer(0.05, finish)
+    timer.start()
+
+    reader = new_model()
+    shared.read(reader)
+    timer.join()
+
+    assert reader.version == 4
+    assert reader.coefs_.tolist() == [9, 9, 9, 9]
+
+
+def test_reads_are_never_torn(shared):
+
+    done = threading.Event()
+
+    def publish():
+        writer = new_model()
+        value  = 0
+        while not done.is_set():
+            value += 1
+            writer.coefs_ = np.full(4, value, dtype=np.float64)
+            shared.publish(writer)
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+
+    try:
+        reader = new_model()
+        for _ in range(2000):
+            shared.read(reader)
+            assert len( set(reader.coefs_.tolist()) ) == 1
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_other_processes_attach_to_the_block(shared):
+
+    writer = new_model([4, 3, 2, 1])
+    writer.version = 7
+    shared.publish(writer)
+
+    # Pickling attaches to the block instead of copying it.
+    assert len( pickle.dumps(shared) ) < 1000
+
+    context = multiprocessing.get_context('spawn')
+    queue   = context.Queue()
+    process = context.Process( target=read_version, args=(shared, queue) )
+    process.start()
+    result = queue.get(timeout=60)
+    process.join()
+
+    assert result == (7, [4, 3, 2, 1])
@@ -0,0 +1,240 @@
+import socket
+import threading
+import zlib
+
+import numpy as np
+import pytest
+
+from checkersml import model
+from checkersml import paramserver
+
+
+def new_model(version=1):
+
+    m = model.LinearRegressionModel(5, 0.1, 0, 0.5)
+    m.coefs_  = np.arange(5, dtype=np.float64) / 7
+    m.version = version
+
+    return m
+
+
+def new_trajectory(version, turns=6):
+    return paramserver.pack_trajectory( version, 'Loss', turns, 1.25, np.linspace(0, 1, turns),
+                                        np.arange(5 * turns, dtype=np.float64).reshape(turns, 5) )
+
+
+@pytest.fixture
+def server():
+
+    server = paramserver.ParameterServer( ('127.0.0.1', 0), new_model(), max_pending=2, max_staleness=1 )
+    server.start()
+    yield server
+    server.close()
+
+
+def connect(server):
+    return socket.create_connection(server.server_address, timeout=10)
+
+
+def request(sock, kind, body=b''):
+
+    paramserver.send_message(sock, kind, body)
+
+    return paramserver.receive_message(sock)
+
+
+def push(sock, body):
+
+    kind, reply = request(sock, paramserver.PUSH_TRAJECTORY, body)
+    assert kind == paramserver.STATUS
+
+    return paramserver.STATUS_BODY.unpack(reply)
+
+
+####### MESSAGES #######
+
+def test_weights_round_trip():
+
+    source = new_model(version=12)
+    target = model.LinearRegressionModel(5, 0, 0, 0)
+
+    paramserver.unpack_weights( target, paramserver.pack_weights(source) )
+
+    assert target.version == 12
+    assert target.coefs_.tolist() == source.coefs_.tolist()
+
+
+@pytest.mark.parametrize('body', [
+    paramserver.pack_weights( new_model(version=12) )[:4],
+    paramserver.pack_weights( new_model(version=12) )[:-8],
+    paramserver.pack_weights( new_model(version=12) ) + bytes(8),
+])
+def test_weights_of_another_size_are_rejected(body):
+
+    target = new_model(version=2)
+
+    with pytest.raises(ConnectionError):
+        paramserver.unpack_weights(target, body)
+
+    assert target.version == 2
+
+
+def test_trajectory_round_trip():
+
+    scores   = np.array([0.5, -0.25, 1])
+    features = np.arange(12, dtype=np.float64).reshape(3, 4)
+
+    body = paramserver.pack_trajectory(9, 'Tie', 3, 2.5, scores, features)
+    version, outcome, turn_count, elapsed, got_scores, got_features = paramserver.unpack_trajectory(body)
+
+    assert (version, outcome, turn_count, elapsed) == (9, 'Tie', 3, 2.5)
+    assert got_scores.tolist() == scores.tolist()
+    assert got_features.tolist() == features.tolist()
+
+
+@pytest.mark.parametrize('body', [
+    b'',
+    new_trajectory(1)[:20],
+    new_trajectory(1)[:-4],
+    new_trajectory(1) + b'trailing',
+    paramserver.TRAJECTORY_HEADER.pack(1, 0, 6, 1.0, 6, 5) + b'not compressed',
+    paramserver.TRAJECTORY_HEADER.pack(1, 9, 1, 1.0, 1, 1) + zlib.compress(bytes(16)),
+    paramserver.TRAJECTORY_HEADER.pack(1, 0, 1, 1.0, 1, 1) + zlib.compress(bytes(1 << 20)),
+    paramserver.TRAJECTORY_HEADER.pack(1, 0, 1, 1.0, 1 << 30, 1 << 30),
+    paramserver.pack_trajectory( 1, 'Win', 2, 1.0, [0.5, np.nan], np.zeros((2, 5)) ),
+    paramserver.pack_trajectory( 1, 'Win', 2, 1.0, [0.5, 0.5], np.full((2, 5), -np.inf) ),
+])
+def test_malformed_trajectories_are_rejected(body):
+
+    with pytest.raises(ValueError):
+        paramserver.unpack_trajectory(body)
+
+
+def test_trajectories_of_another_width_are_rejected():
+
+    body = new_trajectory(1)
+    assert paramserver.unpack_trajectory(body, 5)[5].shape == (6, 5)
+
+    with pytest.raises(ValueError):
+        paramserver.unpack_trajectory(body, 38)
+
+
+####### SERVER #######
+
+def test_pull_and_push(server):
+
+    with connect(server) as sock:
+        kind, body = request(sock, paramserver.PULL_WEIGHTS)
+        assert kind == paramserver.WEIGHTS
+
+        pulled = model.LinearRegressionModel(5, 0, 0, 0)
+        paramserver.unpack_weights(pulled, body)
+        assert pulled.coefs_.tolist() == new_model().coefs_.tolist()
+
+        assert push(sock, new_trajectory(1)) == (paramserver.ACCEPTED, 1)
+
+    message = server.trajectories.get(timeout=10)
+    assert message[2:5] == (1, 'Loss', 6)
+    assert message[6].shape == (6,) and message[7].shape == (6, 5)
+
+
+def test_stale_busy_and_stopped_replies(server):
+
+    with connect(server) as sock:
+        server.publish( new_model(version=2) )
+        server.publish( new_model(version=3) )
+
+        assert push(sock, new_trajectory(1)) == (paramserver.STALE, 3)
+        assert push(sock, new_trajectory(2)) == (paramserver.ACCEPTED, 3)
+        assert push(sock, new_trajectory(3)) == (paramserver.ACCEPTED, 3)
+        assert push(sock, new_trajectory(3)) == (paramserver.BUSY, 3)
+
+        server.stop()
+        assert push(sock, new_trajectory(3)) == (paramserver.STOPPED, 3)
+
+        kind, _ = request(sock, paramserver.PULL_WEIGHTS)
+        assert kind == paramserver.STATUS
+
+    assert server.stale_games == 1
+    assert server.busy_replies == 1
+
+
+def test_malformed_trajectory_keeps_the_connection(server):
+
+    with connect(server) as sock:
+        assert push(sock, b'garbage') == (paramserver.REJECTED, 1)
+        assert push(sock, new_trajectory(1)) == (paramserver.ACCEPTED, 1)
+
+    assert server.rejected_games == 1
+
+
+def test_trajectories_that_do_not_fit_the_model_are_rejected(server):
+
+    narrow = paramserver.pack_trajectory( 1, 'Loss', 3, 1.0, np.zeros(3), np.zeros((3, 4)) )
+    broken = paramserver.pack_trajectory( 1, 'Loss', 3, 1.0, [0, np.inf, 0], np.zeros((3, 5)) )
+
+    with connect(server) as sock:
+        assert push(sock, narrow) == (paramserver.REJECTED, 1)
+        assert push(sock, broken) == (paramserver.REJECTED, 1)
+
+    assert server.rejected_games == 2
+    assert server.trajectories.empty()
+
+
+def test_oversized_message_closes_only_its_connection(server):
+
+    with connect(server) as sock:
+        sock.sendall( paramserver.HEADER.pack(paramserver.PUSH_TRAJECTORY, paramserver.MAX_MESSAGE_SIZE + 1) )
+        assert sock.recv(16) == b''
+
+    with connect(server) as sock:
+        kind, _ = request(sock, paramserver.PULL_WEIGHTS)
+        assert kind == paramserver.WEIGHTS
+
+
+####### REMOTE ACTOR #######
+
+def new_actor(tmp_path, port):
+
+    return paramserver.RemoteActor( ('127.0.0.1', port),
+                                    dict(save_file=str(tmp_path / 'trainee.pickle'), no_records=True),
+                                    dict(save_file=str(tmp_path / 'opponent.pickle'), no_records=True) )
+
+
+def test_actor_connects_again_after_a_broken_message(tmp_path):
+
+    trainee = model.LinearRegressionModel(38, 0, 0, 0)
+    replies = [ (paramserver.WEIGHTS, paramserver.pack_weights(trainee)[:-8]),
+                (paramserver.STATUS, paramserver.STATUS_BODY.pack(paramserver.STOPPED, 1)) ]
+
+    # Answers the weights request of every connection with the next reply, and closes it.
+    def serve(listener):
+        for kind, body in replies:
+            sock, _ = listener.accept()
+            with sock:
+                paramserver.receive_message(sock)
+                paramserver.send_message(sock, kind, body)
+
+    with socket.create_server( ('127.0.0.1', 0) ) as listener:
+        thread = threading.Thread( target=serve, args=(listener,) )
+        thread.start()
+
+        actor = new_actor( tmp_path, listener.getsockname()[1] )
+        actor.run()
+        thread.join(timeout=10)
+
+    assert actor.reconnects == 1
+    assert actor.games_played == 0
+
+
+def test_actor_gives_up_once_the_learner_is_gone(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(paramserver, 'RETRY_DELAY', 0)
+
+    with socket.create_server( ('127.0.0.1', 0) ) as listener:
+        port = listener.getsockname()[1]
+
+    actor = new_actor(tmp_path, port)
+    actor.run()
+
+    assert actor.reconnects == paramserver.MAX_RECONNECTS
@@ -0,0 +1,262 @@
+import tracemalloc
+
+import pytest
+
+from checkersml import board
+from checkersml import player
+
+from .common import get_positions, make_player, new_board, random_coefs, set_search_position
+
+
+DEPTH = 3
+
+
+####### REFERENCE SEARCH #######
+
+def reference_quiescence(agent, maximizing, color):
+    '''
+    Plain minimax over every jump sequence until the position is quiet.
+    '''
+
+    b     = agent.board
+    jumps = b.get_jump_sequences(color)
+    if not jumps:
+        return agent.evaluate_board()
+
+    next_color = 'white' if color == 'black' else 'black'
+    scores     = []
+
+    for move in jumps:
+        b.temporary_update(move)
+
+        if b.game_over:
+            scores.append( agent.evaluate_board() )
+        elif not b.has_legal_moves(next_color):
+            scores.append( -1 if agent.color == next_color else 1 )
+        else:
+            scores.append( reference_quiescence(agent, not maximizing, next_color) )
+
+        b.undo_temporary_update()
+
+    return max(scores) if maximizing else min(scores)
+
+
+def reference_minimax(agent, move, maximizing, color, depth, quiescence):
+    '''
+    Plain minimax without pruning, scoring positions like MLPlayer.minimax_search() does.
+    '''
+
+    b        = agent.board
+    undo_key = b.temporary_update(move)
+
+    try:
+        if b.game_over:
+            return agent.evaluate_board()
+
+        if not b.get_all_legal_moves(color, cache=False):
+            return -1 if agent.color == color else 1
+
+        if depth == DEPTH:
+            return reference_quiescence(agent, maximizing, color) if quiescence else agent.evaluate_board()
+
+        # Multi-jumps are whole moves, so every move hands the turn over.
+        next_color = 'white' if color == 'black' else 'black'
+        moves      = b.get_jump_sequences(color) or b.get_all_legal_moves(color, cache=False)
+        scores     = [ reference_minimax(agent, m, not maximizing, next_color, depth + 1, quiescence) for m in moves ]
+
+        return max(scores) if maximizing else min(scores)
+
+    finally:
+        b.undo_temporary_update(undo_key)
+
+
+def reference_scores(agent, legal_moves, quiescence):
+    '''
+    Returns the minimax score of every root move.
+    '''
+
+    next_color = 'white' if agent.color == 'black' else 'black'
+
+    return [ reference_minimax(agent, move, False, next_color, 0, quiescence) for move in legal_moves ]
+
+
+####### TESTS #######
+
+def search(agent, snapshot):
+
+    set_search_position(agent, snapshot)
+    agent.depth_limit = DEPTH
+
+    legal_moves = agent.board.get_all_compound_moves(agent.color)
+
+    return legal_moves, agent.search_root(legal_moves)
+
+
+@pytest.mark.parametrize('quiescence_budget', [0, 100000])
+def test_search_matches_plain_minimax(tmp_path, quiescence_budget):
+
+    agent = make_player( tmp_path, new_board(), random_coefs(), search_depth=DEPTH,
+                         quiescence_budget=quiescence_budget )
+
+    for snapshot in get_positions(12):
+        legal_moves, (score, move, pv) = search(agent, snapshot)
+        scores = reference_scores( agent, legal_moves, quiescence_budget > 0 )
+
+        assert score == pytest.approx( max(scores) )
+        assert scores[ legal_moves.index(move) ] == pytest.approx(score)
+        assert pv[0] is move
+
+        # Searching again with the transposition table filled gives the same result.
+        _, (again, _, _) = search(agent, snapshot)
+        assert again == pytest.approx(score)
+
+
+def test_principal_variation_leads_to_the_score(tmp_path):
+
+    agent = make_player( tmp_path, new_board(), random_coefs(seed=1), search_depth=DEPTH )
+    b     = agent.board
+
+    for snapshot in get_positions(12, seed=1):
+        _, (score, _, pv) = search(agent, snapshot)
+
+        # Every move of the line is legal where it is played.
+        undo_keys = []
+        for move in pv:
+            moves = b.get_all_compound_moves(b.color_to_move, cache=False)
+
+            assert move.code in [ m.code for m in moves ]
+            undo_keys.append( b.temporary_update(move) )
+
+        # Its leaf is scored by the evaluation function unless the player in turn is blocked.
+        if b.game_over or b.get_all_legal_moves(b.color_to_move, cache=False):
+            assert agent.evaluate_board() == pytest.approx(score)
+            assert agent.evaluate( agent.compute_features() ) == pytest.approx(score)
+
+        for undo_key in reversed(undo_keys):
+            b.undo_temporary_update(undo_key)
+
+
+def test_null_windows_and_aspiration_do_not_change_the_score(tmp_path):
+
+    agent = make_player( tmp_path, new_board(), random_coefs(seed=1), search_depth=DEPTH )
+
+    for snapshot in get_positions(8, seed=1):
+        legal_moves, (score, _, _) = search(agent, snapshot)
+
+        # Windows around the score, above it and below it all end up with the same score.
+        for guess in (score, score + 1, score - 1):
+            for window in (0.01, 0.5):
+                agent.aspiration_window = window
+                agent.tt.clear()
+                agent.move_orderer.new_search()
+
+                result = agent.aspiration_search(legal_moves, guess)
+                assert result[0] == pytest.approx(score)
+
+    assert agent.null_window_searches > 0
+    assert agent.aspiration_failures > 0
+
+
+def test_iterative_deepening_matches_fixed_depth(tmp_path):
+
+    coefs   = random_coefs(seed=2)
+    fixed   = make_player( tmp_path, new_board(), coefs, search_depth=DEPTH )
+    deepens = make_player( tmp_path, new_board(), coefs, search_depth=DEPTH, time_budget=10**6 )
+
+    for snapshot in get_positions(8, seed=2):
+        _, (score, _, _) = search(fixed, snapshot)
+
+        set_search_position(deepens, snapshot)
+        result = deepens.iterative_deepening( deepens.board.get_all_compound_moves('black') )
+
+        assert deepens.completed_depth == DEPTH
+        assert result[0] == pytest.approx(score)
+
+
+def test_search_leaves_the_board_unchanged(tmp_path):
+
+    agent = make_player( tmp_path, new_board(), random_coefs(), search_depth=DEPTH )
+
+    for snapshot in get_positions(4):
+        search(agent, snapshot)
+
+        assert agent.board.get_snapshot() == snapshot
+        assert agent.board.undo_count == 0
+        assert agent.ply == 0
+
+
+def test_allocations_are_traced_per_search_node(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(board.Board, 'trace_allocations', True)
+    agent = make_player( tmp_path, new_board(), random_coefs(), search_depth=DEPTH )
+
+    tracemalloc.start()
+    try:
+        for snapshot in get_positions(2):
+            search(agent, snapshot)
+    finally:
+        tracemalloc.stop()
+
+    # Every node is left once, quiescence nodes included, and the moves a node lists are its own.
+    assert agent.traced_nodes == agent.nodes_searched
+    assert 0 < agent.allocating_nodes <= agent.traced_nodes
+    assert agent.get_allocations_per_node()[0] > 0
+
+
+def test_moves_are_generated_in_stages(tmp_path):
+
+    agent = make_player( tmp_path, new_board(), random_coefs(), search_depth=DEPTH )
+    moves = agent.board.get_all_legal_moves('black', cache=False)
+    white = agent.board.get_all_legal_moves('white', cache=False)
+
+    # The first killer is the hash move and the second one is not legal for black.
+    hash_move = moves[3]
+    agent.move_orderer.killers[1][:] = [hash_move.code, white[0].code]
+    agent.move_orderer.killers[2][:] = [moves[5].code, hash_move.code]
+
+    generated = agent.generate_moves('black', 1, hash_move.code)
+    assert next(generated).code == hash_move.code
+
+    rest = [ m for m in moves if m is not hash_move ]
+    agent.move_orderer.order(rest, 1)
+    assert [ m.code for m in generated ] == [ m.code for m in rest ]
+
+    # The killers of a depth come right after the hash move, each one once.
+    generated = list( agent.generate_moves('black', 2, hash_move.code) )
+    assert [ m.code for m in generated[:2] ] == [hash_move.code, moves[5].code]
+    assert sorted( m.code for m in generated ) == sorted( m.code for m in moves )
+
+
+def test_moves_are_ordered_by_hash_move_promotion_killers_and_history():
+
+    moves     = new_board().get_all_legal_moves('black')
+    promotion = board.Move([0, 6], [1, 7], promote=True)
+
+    a, b, c, d, e = moves[:5]
+    orderer = player.MoveOrderer()
+
+    # c caused a cutoff at this depth, and d a deeper one at another depth.
+    orderer.record_cutoff(c, 1, 1, 3)
+    orderer.record_cutoff(d, 2, 3, 0)
+
+    ordered = [a, b, c, d, e, promotion]
+    orderer.order( ordered, 1, e.code )
+    assert ordered == [e, promotion, c, d, a, b]
+
+    # A new search forgets the killer moves and halves the history scores.
+    orderer.new_search()
+
+    ordered = [a, b, c, d, e, promotion]
+    orderer.order(ordered, 1)
+    assert ordered == [promotion, d, a, b, c, e]
+
+    assert (orderer.cutoffs, orderer.first_move_cutoffs) == (2, 1)
+
+
+def test_rejects_unsupported_depths(tmp_path):
+
+    with pytest.raises(ValueError):
+        make_player( tmp_path, new_board(), random_coefs(), search_depth=-1 )
+
+    with pytest.raises(ValueError):
+        make_player( tmp_path, new_board(), random_coefs(), search_depth=65 )
@@ -0,0 +1,60 @@
+import pytest
+
+from checkersml import board
+
+from .common import get_positions, make_player, random_coefs, set_search_position
+
+
+DEPTH = 3
+
+
+def check_pv(agent, snapshot, pv):
+    '''
+    Checks that every move of a principal variation is legal where it is played.
+    '''
+
+    b = agent.board
+    b.set_snapshot(snapshot)
+
+    for move in pv:
+        codes = [ m.code for m in b.get_all_compound_moves(b.color_to_move, cache=False) ]
+        assert move.code in codes
+        b.temporary_update(move)
+
+    for _ in pv:
+        b.undo_temporary_update()
+
+
+@pytest.mark.parametrize('scale', [1, 0])
+def test_pool_finds_the_sequential_move_and_score(tmp_path, scale):
+
+    coefs = random_coefs(scale)
+
+    sequential = make_player( tmp_path, board.Board(), coefs, search_depth=DEPTH )
+    pooled     = make_player( tmp_path, board.Board(), coefs, search_depth=DEPTH, search_processes=2 )
+
+    try:
+        for snapshot in get_positions(20):
+            results = []
+
+            for agent in (sequential, pooled):
+                set_search_position(agent, snapshot)
+                agent.depth_limit = DEPTH
+
+                legal_moves = agent.board.get_all_compound_moves('black')
+
+                if agent.search_pool is None:
+                    score, move, pv = agent.search_root(legal_moves)
+                else:
+                    score, move, pv = agent.search_pool.search_root(agent, legal_moves)
+
+                # The principal variations may differ between lines with the same score.
+                assert pv[0] is move
+                check_pv(agent, snapshot, pv)
+
+                results.append( (score, move.code) )
+
+            assert results[0] == results[1]
+
+    finally:
+        pooled.close()
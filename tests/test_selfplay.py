@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+
+from checkersml import board
+from checkersml import player
+from checkersml import selfplay
+
+from .common import random_coefs
+
+
+def new_players(tmp_path, **config):
+    '''
+    Returns a board with a trainee playing black against a random white player. The TD(lambda)
+    steps of the trainee model are kept in its 'steps' list.
+    '''
+
+    b = board.Board()
+
+    trainee  = player.LinearModelPlayer( 'black', b, train=True, search_depth=1, epsilon=0.1, no_records=True,
+                                         save_file=str(tmp_path / 'trainee.pickle'), **config )
+    opponent = player.LinearModelPlayer( 'white', b, epsilon=1, no_records=True,
+                                         save_file=str(tmp_path / 'opponent.pickle') )
+
+    trainee.model.coefs_ = random_coefs(scale=0.1)
+
+    steps         = []
+    td_lambda     = trainee.model.td_lambda
+    trainee.steps = steps
+
+    def record(prev_state, next_state):
+        steps.append( (prev_state, next_state) )
+        td_lambda(prev_state, next_state)
+
+    trainee.model.td_lambda = record
+
+    return b, trainee, opponent
+
+
+def play(tmp_path, seed, trajectory, **config):
+    '''
+    Plays a seeded game like an actor does, and returns the trainee and the outcome.
+    '''
+
+    b, trainee, opponent = new_players(tmp_path, **config)
+    if trajectory:
+        trainee.trajectory = []
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+    return trainee, selfplay.play_game(b, trainee, opponent)
+
+
+def as_lists(steps):
+    return [ ( prev and (prev.score, prev.features.tolist()), (state.score, state.features.tolist()) )
+             for prev, state in steps ]
+
+
+def test_learner_replays_the_steps_of_serial_training(tmp_path):
+
+    for seed in range(3):
+        # Without learning, the serial game and the recorded one are the same game.
+        serial, outcome = play(tmp_path, seed, False)
+        actor, again    = play(tmp_path, seed, True)
+
+        assert again == outcome
+        assert actor.steps == []
+        assert actor.model.coefs_.tolist() == random_coefs(scale=0.1).tolist()
+
+        _, learner, _ = new_players(tmp_path)
+        learner.learn_trajectory(actor.trajectory)
+
+        assert as_lists(learner.steps) == as_lists(serial.steps)
+
+
+def test_learner_updates_the_model_once_per_transition(tmp_path):
+
+    b, actor, opponent = new_players(tmp_path, learning_rate=0.01, lambda_const=0.7)
+    _, _, _, scores, features = selfplay.play_trajectory(b, actor, opponent)
+
+    assert scores.shape == (len(actor.trajectory),)
+    assert features.shape == (len(actor.trajectory), 38)
+
+    _, learner, _ = new_players(tmp_path, learning_rate=0.01, lambda_const=0.7)
+    version = learner.model.version
+    learner.learn_trajectory( [ player.State(score, values) for score, values in zip(scores, features) ] )
+
+    assert learner.model.version == version + len(scores) - 1
+    assert learner.model.coefs_.tolist() != actor.model.coefs_.tolist()
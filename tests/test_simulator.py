@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from checkersml import board
+from checkersml import features
+from checkersml import simulator
+
+from .common import new_board, random_coefs
+
+
+def check_against_boards(sim):
+    '''
+    Plays the games of a simulator to the end along with a Board for each, checking that both
+    agree on the legal hops and on the state after every one of them.
+    '''
+
+    boards    = [ new_board() for _ in range(sim.games) ]
+    extractor = features.VectorizedFeatureExtractor('black')
+
+    while sim.game_over.min() == 0:
+        for row, k in enumerate( sim.get_active() ):
+            b = boards[k]
+
+            expected = sorted( (m.src_square, m.dst_square) for m in b.get_all_legal_moves(b.player_in_turn.color) )
+            hops     = np.flatnonzero(sim.legal_hops[row])
+            assert sorted( (simulator.HOP_SOURCES[h], simulator.HOP_DESTINATIONS[h]) for h in hops ) == expected
+
+        games, hops = sim.step()
+
+        for k, hop in zip(games, hops):
+            b   = boards[k]
+            src = board.SQUARE_COORDS[ simulator.HOP_SOURCES[hop] ]
+            dst = board.SQUARE_COORDS[ simulator.HOP_DESTINATIONS[hop] ]
+            b.update( board.Move(list(src), list(dst)) )
+
+            assert ( extractor.positions_to_arrays([ b.get_position() ])[0] == sim.tiles[k, :32] ).all()
+            assert int(b.game_over) == sim.game_over[k]
+            assert (b.turn_count, b.no_jump_count) == (sim.turn_count[k], sim.no_jump_count[k])
+
+            if b.game_over in (simulator.NO_PIECES_LEFT, simulator.NO_MOVES_LEFT):
+                assert simulator.COLORS[ sim.winner[k] ] == b.player_in_turn.color
+            elif not b.game_over:
+                assert simulator.COLORS[ sim.turn[k] ] == b.player_in_turn.color
+                jump_square = -1 if b.required_src is None else board.coords_to_square(*b.required_src)
+                assert jump_square == sim.jump_square[k]
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_random_games_follow_the_board_rules(seed):
+
+    sim = simulator.BatchSimulator(60, seed=seed)
+    check_against_boards(sim)
+
+    assert sim.positions > 0
+
+
+def test_model_policies_follow_the_board_rules():
+
+    sim = simulator.BatchSimulator(40, seed=2)
+    sim.set_policy('black', random_coefs(seed=5), 0.1)
+    sim.set_policy('white', random_coefs(seed=6), 0.3)
+
+    check_against_boards(sim)
+
+
+def test_greedy_policy_picks_the_best_scored_hop():
+
+    coefs = random_coefs(seed=7)
+    sim   = simulator.BatchSimulator(20, seed=3)
+    sim.set_policy('black', coefs, 0)
+
+    games = sim.get_active()
+    hops  = sim.choose_hops( games, sim.legal_hops, 0 )
+
+    extractor = features.VectorizedFeatureExtractor('black')
+    for row, (k, hop) in enumerate( zip(games, hops) ):
+        best = None
+        for candidate in np.flatnonzero(sim.legal_hops[row]):
+            tiles = sim.tiles[k:k+1].copy()
+            sim.move_pieces( tiles, np.array([0]), np.array([candidate]) )
+            score = extractor.extract(tiles[:, :32])[0] @ coefs
+            if best is None or score > best[0]:
+                best = (score, candidate)
+
+        assert hop == best[1]
+
+
+def test_unknown_colors_are_rejected():
+
+    with pytest.raises(ValueError):
+        simulator.BatchSimulator(1).set_policy('red')